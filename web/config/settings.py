@@ -20,6 +20,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # brotli/gzip + métricas de bytes/CPU por request (maps/middleware.py)
+    "maps.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -60,6 +62,26 @@ DATABASES = {
     }
 }
 
+# Control de admisión por endpoint (maps/admission.py): consultas simultáneas
+# por worker y statement_timeout por vista. 0 = sin statement_timeout.
+# La cancelación de consultas cuyo cliente se desconectó solo funciona bajo
+# gunicorn; con runserver (docker-compose.yml actual) está desactivada.
+ADMISSION_WAIT_MS = int(os.environ.get("ADMISSION_WAIT_MS", 50))
+ADMISSION_LIMITS = {
+    "hex_formaciones": {
+        "concurrency": int(os.environ.get("HEX_FORMACIONES_CONCURRENCY", 4)),
+        "statement_timeout_ms": int(os.environ.get("HEX_FORMACIONES_TIMEOUT_MS", 3000)),
+    },
+    "admin_lists": {
+        "concurrency": int(os.environ.get("ADMIN_LISTS_CONCURRENCY", 16)),
+        "statement_timeout_ms": int(os.environ.get("ADMIN_LISTS_TIMEOUT_MS", 2000)),
+    },
+    "export": {
+        "concurrency": int(os.environ.get("EXPORT_CONCURRENCY", 2)),
+        "statement_timeout_ms": 0,
+    },
+}
+
 LANGUAGE_CODE = "es-cl"
 TIME_ZONE = "America/Santiago"
 USE_I18N = True
@@ -0,0 +1,20 @@
+from django.contrib import admin
+
+from .jobs import request_cancel
+from .models import ImportJob
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "stage", "progress", "rows_done", "rows_per_s", "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    readonly_fields = (
+        "status", "cancel_requested", "stage", "stages", "progress", "rows_done", "rows_total",
+        "rows_per_s", "message", "worker", "created_at", "started_at", "finished_at", "updated_at",
+    )
+    actions = ["cancel_jobs"]
+
+    @admin.action(description="Cancelar trabajos seleccionados")
+    def cancel_jobs(self, request, queryset):
+        for job in queryset.filter(status__in=[ImportJob.STATUS_QUEUED, ImportJob.STATUS_RUNNING]):
+            request_cancel(job.pk)
@@ -0,0 +1,186 @@
+"""
+Control de admisión para endpoints con consultas espaciales caras.
+
+Cada endpoint tiene su propio "gate" (settings.ADMISSION_LIMITS):
+- concurrency: consultas simultáneas por proceso; si no hay cupo en
+  ADMISSION_WAIT_MS se responde 503 de inmediato (load shedding)
+- statement_timeout_ms: se aplica con SET LOCAL dentro de la transacción de
+  la vista; si Postgres cancela la consulta se responde 503
+Si el cliente se desconecta, la consulta en curso se cancela con pg_cancel,
+también durante el streaming de la respuesta (export NDJSON). Esto requiere
+gunicorn (environ["gunicorn.socket"]); con runserver, que es lo que usa hoy
+docker-compose.yml, la cancelación por desconexión NO está activa y solo
+aplican el cupo y el statement_timeout.
+Todo queda contado en maps.metrics (grupo admission.<gate>).
+
+Así hex_formaciones no puede acaparar conexiones/CPU de la base y dejar sin
+recursos a regions o a Tegola.
+"""
+import functools
+import select
+import socket
+import threading
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.http import JsonResponse
+
+from . import metrics
+
+DEFAULT_LIMITS = {"concurrency": 8, "statement_timeout_ms": 5000}
+DISCONNECT_POLL_SECONDS = 0.25
+RETRY_AFTER_SECONDS = 2
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def _limits(name):
+    limits = dict(DEFAULT_LIMITS)
+    limits.update(getattr(settings, "ADMISSION_LIMITS", {}).get(name, {}))
+    return limits
+
+
+def _gate(name):
+    with _gates_lock:
+        if name not in _gates:
+            _gates[name] = threading.BoundedSemaphore(_limits(name)["concurrency"])
+        return _gates[name]
+
+
+def _degraded(name, reason):
+    metrics.incr(f"admission.{name}", reason)
+    response = JsonResponse(
+        {"ok": False, "error": "Servicio saturado, intenta nuevamente", "reason": reason},
+        status=503,
+    )
+    response["Retry-After"] = str(RETRY_AFTER_SECONDS)
+    return response
+
+
+def _is_query_canceled(exc):
+    # 57014 = query_canceled (statement_timeout o pg_cancel_backend)
+    return getattr(exc.__cause__, "pgcode", None) == "57014"
+
+
+def _peer_closed(sock):
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
+
+
+def _watch_disconnect(request, state):
+    """
+    Cancela la consulta en curso si el cliente cierra la conexión (solo gunicorn).
+    Retorna la función que detiene el watcher (no-op si no hay socket).
+    """
+    sock = request.META.get("gunicorn.socket")
+    if sock is None:
+        return lambda: None
+
+    connection.ensure_connection()
+    pg = connection.connection
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(DISCONNECT_POLL_SECONDS):
+            if _peer_closed(sock):
+                state["disconnected"] = True
+                pg.cancel()
+                return
+
+    t = threading.Thread(target=watch, name="favex-disconnect-watch", daemon=True)
+    t.start()
+    return done.set
+
+
+class _ReleaseOnClose:
+    """Iterador de streaming_content que libera el cupo al agotarse o al cerrarse la respuesta."""
+
+    def __init__(self, content, release):
+        self._it = iter(content)
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            self._release()
+            raise
+
+    def close(self):
+        try:
+            if hasattr(self._it, "close"):
+                self._it.close()
+        finally:
+            self._release()
+
+
+def admission_control(name):
+    """Decorador: limita concurrencia y tiempo de consulta de la vista `name`."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limits = _limits(name)
+            gate = _gate(name)
+            wait = getattr(settings, "ADMISSION_WAIT_MS", 50) / 1000.0
+            if not gate.acquire(timeout=wait):
+                return _degraded(name, "shed")
+
+            metrics.incr(f"admission.{name}", "admitted")
+            state = {"disconnected": False}
+            released = False
+            stop_watch = lambda: None
+
+            def release():
+                # El watcher vive hasta que se libera el cupo (en streaming,
+                # hasta que termina de enviarse la respuesta)
+                nonlocal released
+                if not released:
+                    released = True
+                    stop_watch()
+                    gate.release()
+
+            try:
+                stop_watch = _watch_disconnect(request, state)
+                timeout_ms = int(limits["statement_timeout_ms"])
+                if timeout_ms > 0:
+                    with transaction.atomic():
+                        with connection.cursor() as cur:
+                            cur.execute("SELECT set_config('statement_timeout', %s, true)", [str(timeout_ms)])
+                        response = view(request, *args, **kwargs)
+                else:
+                    response = view(request, *args, **kwargs)
+            except OperationalError as e:
+                release()
+                if not _is_query_canceled(e):
+                    raise
+                if state["disconnected"]:
+                    return _degraded(name, "client_disconnected")
+                return _degraded(name, "timeout")
+            except BaseException:
+                release()
+                raise
+
+            # En respuestas streaming el cupo se libera al terminar de enviar
+            if getattr(response, "streaming", False):
+                def release_streaming():
+                    if state["disconnected"] and not released:
+                        metrics.incr(f"admission.{name}", "client_disconnected")
+                    release()
+
+                response.streaming_content = _ReleaseOnClose(response.streaming_content, release_streaming)
+            else:
+                release()
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,229 @@
+"""
+Bus de invalidación de caché entre workers/containers (PostgreSQL LISTEN/NOTIFY).
+
+- Quien escribe datos (import_shp, build_hex_pyramid) llama a
+  notify_table_change(): incrementa maps_dataversion y publica un NOTIFY
+  en el canal CHANNEL con {"table", "version", "bbox"} en la misma transacción.
+- Cada proceso web levanta (en forma perezosa) un hilo que escucha el canal
+  y mantiene el mapa tabla -> versión.
+- cached_json() arma la key de caché y el ETag a partir de las versiones de
+  las tablas de las que depende la vista, por lo que el ETag es el mismo en
+  toda la flota mientras los datos no cambien. Las entradas de versiones
+  anteriores no se vuelven a pedir y expiran solas (no se rastrean keys).
+"""
+import functools
+import hashlib
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotModified
+from sqlalchemy import text
+
+from maps.hexgrid import quote_ident
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "favex_data"
+CACHE_TIMEOUT = 60 * 60
+LISTEN_POLL_SECONDS = 5.0
+RECONNECT_SECONDS = 5.0
+
+
+# ---------------------------------------------------------------------------
+# Publicación (lado import)
+# ---------------------------------------------------------------------------
+
+def notify_table_change(engine, table: str, schema: str = "public"):
+    """
+    Incrementa la versión de `table` y publica el cambio.
+
+    `engine` es un engine de SQLAlchemy (igual que en import_shp). El bbox se
+    toma de geom_3857 si la tabla lo tiene. Retorna la nueva versión.
+    """
+    bbox = None
+    with engine.begin() as conn:
+        has_geom = conn.execute(text("""
+            SELECT EXISTS (
+              SELECT 1 FROM information_schema.columns
+              WHERE table_schema = :schema AND table_name = :table AND column_name = 'geom_3857'
+            )
+        """), {"schema": schema, "table": table}).scalar()
+
+        if has_geom:
+            full_table = f"{quote_ident(schema)}.{quote_ident(table)}"
+            row = conn.execute(text(f"""
+                SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+                FROM (SELECT ST_Extent(geom_3857) AS e FROM {full_table}) s
+                WHERE e IS NOT NULL
+            """)).first()
+            if row is not None:
+                bbox = [float(v) for v in row]
+
+        version = conn.execute(text("""
+            INSERT INTO maps_dataversion (table_name, version, updated_at)
+            VALUES (:table, 1, now())
+            ON CONFLICT (table_name) DO UPDATE
+              SET version = maps_dataversion.version + 1,
+                  updated_at = now()
+            RETURNING version
+        """), {"table": table}).scalar()
+
+        payload = json.dumps({"table": table, "version": int(version), "bbox": bbox})
+        # NOTIFY se entrega al hacer commit: los listeners nunca ven una versión sin datos
+        conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+
+    return int(version)
+
+
+# ---------------------------------------------------------------------------
+# Escucha (lado web)
+# ---------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_versions = {}            # tabla -> versión
+_versions_loaded = False
+_listener = None
+
+
+def _load_versions(cur):
+    global _versions_loaded
+    cur.execute("SELECT table_name, version FROM maps_dataversion")
+    rows = cur.fetchall()
+    with _lock:
+        _versions.clear()
+        _versions.update({r[0]: int(r[1]) for r in rows})
+        _versions_loaded = True
+
+
+def _handle_notify(payload):
+    try:
+        msg = json.loads(payload)
+        table = msg["table"]
+        version = int(msg["version"])
+    except (ValueError, KeyError, TypeError):
+        logger.warning("NOTIFY %s con payload inválido: %r", CHANNEL, payload)
+        return
+    with _lock:
+        if version <= _versions.get(table, 0):
+            return
+        _versions[table] = version
+    logger.info("Datos actualizados: %s v%s bbox=%s", table, version, msg.get("bbox"))
+
+
+def _listen_forever():
+    import psycopg2
+    import psycopg2.extensions
+
+    db = settings.DATABASES["default"]
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(
+                dbname=db.get("NAME"),
+                user=db.get("USER"),
+                password=db.get("PASSWORD"),
+                host=db.get("HOST") or "localhost",
+                port=db.get("PORT") or "5432",
+                application_name="favex-cache-listener",
+            )
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL};")
+                # Recarga completa: cubre NOTIFY perdidos mientras no escuchábamos
+                _load_versions(cur)
+
+            while True:
+                if select.select([conn], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _handle_notify(conn.notifies.pop(0).payload)
+        except Exception:
+            logger.exception("Listener %s desconectado; reintentando", CHANNEL)
+            time.sleep(RECONNECT_SECONDS)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def ensure_listener():
+    """Levanta el hilo listener de este proceso (una sola vez)."""
+    global _listener
+    if _listener is not None:
+        return
+    with _lock:
+        if _listener is not None:
+            return
+        _listener = threading.Thread(target=_listen_forever, name="favex-cache-listener", daemon=True)
+        _listener.start()
+
+
+def get_versions(tables):
+    """Versiones actuales de `tables` (0 si nunca se importaron)."""
+    ensure_listener()
+    if not _versions_loaded:
+        with connection.cursor() as cur:
+            _load_versions(cur)
+    with _lock:
+        return tuple(_versions.get(t, 0) for t in tables)
+
+
+# ---------------------------------------------------------------------------
+# Caché de respuestas JSON
+# ---------------------------------------------------------------------------
+
+def cached_json(*tables, params=(), timeout=CACHE_TIMEOUT):
+    """
+    Cachea respuestas 200 de una vista GET según las versiones de `tables`.
+
+    - key de caché = vista + path + valores de `params` (solo los parámetros
+      GET que lee la vista: otros query strings no crean entradas nuevas)
+      + versiones
+    - ETag = hash de la key (igual en todos los workers) y 304 con If-None-Match
+    - al llegar un NOTIFY cambia la versión y con ella la key; las entradas
+      viejas expiran por `timeout` (o antes, por el límite del backend)
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+
+            versions = get_versions(tables)
+            raw_key = "|".join([
+                view.__module__ + "." + view.__name__,
+                request.path,
+                "&".join(f"{p}={request.GET.get(p, '')}" for p in params),
+                ",".join(f"{t}@{v}" for t, v in zip(tables, versions)),
+            ])
+            digest = hashlib.sha1(raw_key.encode("utf-8")).hexdigest()
+            etag = f'"{digest}"'
+
+            if etag in request.headers.get("If-None-Match", ""):
+                return HttpResponseNotModified(headers={"ETag": etag})
+
+            key = f"favex:json:{digest}"
+            hit = cache.get(key)
+            if hit is not None:
+                body, content_type = hit
+                response = HttpResponse(body, content_type=content_type)
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or getattr(response, "streaming", False):
+                    return response
+                cache.set(key, (response.content, response["Content-Type"]), timeout)
+
+            response["ETag"] = etag
+            response["Cache-Control"] = "no-cache"
+            return response
+        return wrapper
+    return decorator
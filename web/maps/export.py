@@ -0,0 +1,302 @@
+"""
+Exportación masiva de capas (NDJSON / FlatGeobuf / GeoParquet).
+
+Las filas se leen con un cursor de servidor (connection.chunked_cursor) en
+bloques de `chunk_size`, así la memoria queda acotada sin importar el tamaño
+de la capa. La usan la vista /api/export/<layer>/ y el comando export_layer.
+
+FlatGeobuf y GeoParquet son formatos con índice/cabecera, por lo que se
+escriben a un archivo (por bloques) y luego se sirven en streaming.
+"""
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+# Capas exportables: tabla, columnas de atributos y filtros administrativos permitidos
+EXPORT_LAYERS = {
+    "hex5km": {
+        "table": "hex5km",
+        "columns": ["gid", "id_hex", "riqueza_sp", "cut_reg", "cut_prov", "cut_com"],
+        "filters": ["cut_reg", "cut_prov", "cut_com"],
+    },
+    "hex20km": {
+        "table": "hex20km",
+        "columns": [
+            "gid", "id_cell", "id_hex_min", "n_hex", "riqueza_sp", "riqueza_sp_avg",
+            "cut_reg", "cut_prov", "cut_com",
+        ],
+        "filters": ["cut_reg", "cut_prov", "cut_com"],
+    },
+    "hex80km": {
+        "table": "hex80km",
+        "columns": [
+            "gid", "id_cell", "id_hex_min", "n_hex", "riqueza_sp", "riqueza_sp_avg",
+            "cut_reg", "cut_prov", "cut_com",
+        ],
+        "filters": ["cut_reg", "cut_prov", "cut_com"],
+    },
+    "formaciones": {
+        "table": "formaciones",
+        "columns": ["gid", "formacion"],
+        "filters": [],
+    },
+}
+
+EXPORT_FORMATS = {
+    "ndjson": {"content_type": "application/x-ndjson", "ext": "ndjson"},
+    "fgb": {"content_type": "application/octet-stream", "ext": "fgb"},
+    "parquet": {"content_type": "application/vnd.apache.parquet", "ext": "parquet"},
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# Límite de latitud de Web Mercator (EPSG:3857)
+MAX_LATITUDE = 85.0511
+
+# OIDs de tipos Postgres -> tipo lógico (para armar el schema de fgb/parquet)
+_PG_INT = {20, 21, 23}
+_PG_FLOAT = {700, 701, 1700}
+_PG_BOOL = {16}
+
+
+class ExportError(ValueError):
+    """Parámetros de exportación inválidos (se traduce a 400 / CommandError)."""
+
+
+class ExportUnavailable(ExportError):
+    """Falta la librería opcional del formato pedido (fiona / pyarrow)."""
+
+
+def parse_bbox(raw):
+    """
+    'minx,miny,maxx,maxy' en EPSG:4326 -> tupla de floats (o None).
+
+    La latitud se recorta a ±MAX_LATITUDE: más allá ST_Transform a 3857
+    falla, y en NDJSON eso pasaría recién dentro del streaming (200 truncado).
+    """
+    if not raw:
+        return None
+    try:
+        parts = [float(x) for x in raw.split(",")]
+    except ValueError:
+        raise ExportError(f"bbox inválido: {raw!r}")
+    if len(parts) != 4 or parts[0] >= parts[2] or parts[1] >= parts[3]:
+        raise ExportError("bbox debe ser minx,miny,maxx,maxy (EPSG:4326)")
+    minx, miny, maxx, maxy = parts
+    if not (-180.0 <= minx <= 180.0 and -180.0 <= maxx <= 180.0
+            and -90.0 <= miny <= 90.0 and -90.0 <= maxy <= 90.0):
+        raise ExportError("bbox fuera de rango (lon -180..180, lat -90..90)")
+    miny = max(miny, -MAX_LATITUDE)
+    maxy = min(maxy, MAX_LATITUDE)
+    if miny >= maxy:
+        raise ExportError(f"bbox fuera del rango de EPSG:3857 (lat ±{MAX_LATITUDE})")
+    return (minx, miny, maxx, maxy)
+
+
+def build_query(layer, fmt, filters=None, bbox=None):
+    """
+    Arma el SELECT de exportación. La geometría sale en EPSG:4326:
+    GeoJSON (texto) para ndjson y WKB para fgb/parquet.
+    """
+    if layer not in EXPORT_LAYERS:
+        raise ExportError(f"Capa no exportable: {layer}")
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Formato no soportado: {fmt} (usa {', '.join(EXPORT_FORMATS)})")
+
+    spec = EXPORT_LAYERS[layer]
+    cols = ", ".join(spec["columns"])
+    if fmt == "ndjson":
+        geom = "ST_AsGeoJSON(ST_Transform(geom_3857, 4326), 6)"
+    else:
+        geom = "ST_AsBinary(ST_Transform(geom_3857, 4326))"
+
+    where = ["geom_3857 IS NOT NULL"]
+    params = []
+    for key, value in (filters or {}).items():
+        if not value:
+            continue
+        if key not in spec["filters"]:
+            raise ExportError(f"La capa {layer} no admite el filtro {key}")
+        where.append(f"{key}::text = %s")
+        params.append(str(value))
+    if bbox:
+        where.append("geom_3857 && ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, 4326), 3857)")
+        params.extend(bbox)
+
+    sql = f"""
+        SELECT {cols}, {geom} AS geom
+        FROM public.{spec["table"]}
+        WHERE {" AND ".join(where)}
+        ORDER BY gid
+    """
+    return sql, params
+
+
+def iter_chunks(sql, params, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Ejecuta `sql` con un cursor de servidor y entrega (description, filas)
+    por bloques de `chunk_size`.
+
+    El cursor se abre dentro de una transacción: en autocommit Django lo
+    declara WITH HOLD y Postgres materializa el resultado completo al hacer
+    commit del DECLARE, antes de entregar la primera fila.
+    """
+    with transaction.atomic(), connection.chunked_cursor() as cur:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield cur.description, rows
+
+
+def _logical_type(type_code):
+    if type_code in _PG_INT:
+        return "int"
+    if type_code in _PG_FLOAT:
+        return "float"
+    if type_code in _PG_BOOL:
+        return "bool"
+    return "str"
+
+
+def _to_python(value):
+    # Decimal (numeric) no es serializable en JSON / fiona
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Writers
+# ---------------------------------------------------------------------------
+
+def _ndjson_chunk(description, rows):
+    names = [d[0] for d in description[:-1]]
+    lines = []
+    for r in rows:
+        props = {k: _to_python(v) for k, v in zip(names, r[:-1])}
+        geom = r[-1]
+        lines.append(
+            '{"type":"Feature","geometry":' + (geom or "null")
+            + ',"properties":' + json.dumps(props, ensure_ascii=False) + "}\n"
+        )
+    return "".join(lines).encode("utf-8")
+
+
+def iter_ndjson(chunks):
+    """Una Feature GeoJSON por línea (bytes), lista para StreamingHttpResponse."""
+    for description, rows in chunks:
+        yield _ndjson_chunk(description, rows)
+
+
+def write_flatgeobuf(chunks, path, spatial_index=True):
+    """Escribe FlatGeobuf por bloques (requiere fiona). Retorna filas escritas."""
+    try:
+        import fiona
+        from shapely import wkb
+        from shapely.geometry import mapping
+    except ImportError:
+        raise ExportUnavailable("FlatGeobuf requiere fiona y shapely instalados")
+
+    n = 0
+    dst = None
+    try:
+        for description, rows in chunks:
+            names = [d[0] for d in description[:-1]]
+            if dst is None:
+                schema = {
+                    "geometry": "Unknown",
+                    "properties": {d[0]: _logical_type(d[1]) for d in description[:-1]},
+                }
+                dst = fiona.open(
+                    str(path), "w", driver="FlatGeobuf", schema=schema, crs="EPSG:4326",
+                    SPATIAL_INDEX="YES" if spatial_index else "NO",
+                )
+            dst.writerecords(
+                {
+                    "geometry": mapping(wkb.loads(bytes(r[-1]))) if r[-1] is not None else None,
+                    "properties": {k: _to_python(v) for k, v in zip(names, r[:-1])},
+                }
+                for r in rows
+            )
+            n += len(rows)
+    finally:
+        if dst is not None:
+            dst.close()
+    return n
+
+
+def write_geoparquet(chunks, path):
+    """Escribe GeoParquet (geometría WKB, un row group por bloque; requiere pyarrow)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportUnavailable("GeoParquet requiere pyarrow instalado")
+
+    pa_types = {"int": pa.int64(), "float": pa.float64(), "bool": pa.bool_(), "str": pa.string()}
+    n = 0
+    writer = None
+    schema = None
+    try:
+        for description, rows in chunks:
+            names = [d[0] for d in description[:-1]]
+            if writer is None:
+                fields = [pa.field(d[0], pa_types[_logical_type(d[1])]) for d in description[:-1]]
+                fields.append(pa.field("geometry", pa.binary()))
+                geo = {
+                    "version": "1.0.0",
+                    "primary_column": "geometry",
+                    "columns": {"geometry": {"encoding": "WKB", "geometry_types": []}},
+                }
+                schema = pa.schema(fields, metadata={b"geo": json.dumps(geo).encode("utf-8")})
+                writer = pq.ParquetWriter(str(path), schema)
+            data = {k: [_to_python(r[i]) for r in rows] for i, k in enumerate(names)}
+            data["geometry"] = [bytes(r[-1]) if r[-1] is not None else None for r in rows]
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            n += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n
+
+
+def write_export(chunks, fmt, path, spatial_index=True):
+    """Escribe `chunks` a `path` en el formato pedido. Retorna filas escritas."""
+    if fmt == "ndjson":
+        n = 0
+        with open(path, "wb") as f:
+            for description, rows in chunks:
+                f.write(_ndjson_chunk(description, rows))
+                n += len(rows)
+        return n
+    if fmt == "fgb":
+        n = write_flatgeobuf(chunks, path, spatial_index=spatial_index)
+    elif fmt == "parquet":
+        n = write_geoparquet(chunks, path)
+    else:
+        raise ExportError(f"Formato no soportado: {fmt}")
+    # fgb/parquet necesitan al menos una fila para armar el schema
+    if n == 0:
+        raise ExportError("La consulta no retornó filas")
+    return n
+
+
+def spool_export(chunks, fmt):
+    """
+    Escribe el export en un directorio temporal y retorna el archivo abierto.
+    El archivo se desvincula apenas se abre: desaparece al cerrarse.
+    """
+    tmpdir = tempfile.mkdtemp(prefix="favex-export-")
+    try:
+        path = os.path.join(tmpdir, "export." + EXPORT_FORMATS[fmt]["ext"])
+        write_export(chunks, fmt, path)
+        f = open(path, "rb")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return f
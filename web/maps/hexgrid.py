@@ -0,0 +1,245 @@
+"""
+Utilidades SQL para la grilla hexagonal (hex5km y niveles agregados).
+
+Todas las funciones reciben un engine de SQLAlchemy (igual que import_shp)
+y trabajan sobre geom_3857.
+"""
+from sqlalchemy import text
+
+
+# Niveles de la pirámide: tamaño de celda (lado del hexágono, en metros EPSG:3857).
+# El nombre de la tabla se deriva del tamaño: 20000 -> hex20km.
+PYRAMID_LEVELS = (20000, 80000)
+
+# Identificador propio de las celdas agregadas (id_hex solo existe en hex5km)
+LEVEL_ID_COL = "id_cell"
+
+
+def quote_ident(ident: str) -> str:
+    return '"' + ident.replace('"', '""') + '"'
+
+
+def level_table_name(size: int) -> str:
+    return f"hex{int(size) // 1000}km"
+
+
+def swap_statements(schema: str, build: str, table: str, index_suffixes=("_pkey", "_geom_3857_gix")):
+    """
+    Sentencias que reemplazan `table` por `build` (ya indexada y analizada).
+    El DROP toma un lock exclusivo sobre la tabla publicada hasta el commit,
+    así que deben ir al final de la transacción: solo DROP + RENAMEs.
+    """
+    full_table = f"{quote_ident(schema)}.{quote_ident(table)}"
+    full_build = f"{quote_ident(schema)}.{quote_ident(build)}"
+    statements = [
+        f"DROP TABLE IF EXISTS {full_table} CASCADE;",
+        f"ALTER TABLE {full_build} RENAME TO {quote_ident(table)};",
+    ]
+    for suffix in index_suffixes:
+        statements.append(
+            f"ALTER INDEX IF EXISTS {quote_ident(schema)}.{quote_ident(build + suffix)} "
+            f"RENAME TO {quote_ident(table + suffix)};"
+        )
+    return statements
+
+
+def build_hex_level(engine, size: int, schema: str = "public", source: str = "hex5km") -> int:
+    """
+    Construye (o reconstruye) un nivel agregado de la grilla a partir de `source`.
+
+    Cada hexágono de `source` se asigna a la celda de ST_HexagonGrid(size) que
+    contiene su ST_PointOnSurface. La grilla está anclada al origen de 3857, así
+    que basta calcular la celda por punto (O(n)) en vez de generar la grilla
+    completa sobre el extent del país.
+
+    Agregados por celda:
+    - id_cell: id propio de la celda en el nivel (no es un id_hex)
+    - id_hex_min: menor id_hex de los hijos (solo para el gradiente del front)
+    - n_hex: cantidad de hexágonos hijos
+    - riqueza_sp: máximo de los hijos (cota inferior de la riqueza de la celda)
+    - riqueza_sp_avg: promedio de los hijos
+    - cut_reg/cut_prov/cut_com: valor más frecuente (moda)
+
+    La tabla se arma (e indexa) en una tabla temporal y se intercambia al
+    final de la misma transacción, para que Tegola no vea la capa a medio
+    construir ni quede esperando el índice.
+    Retorna la cantidad de celdas generadas.
+    """
+    table = level_table_name(size)
+    tmp = f"{table}_build"
+    full_src = f"{quote_ident(schema)}.{quote_ident(source)}"
+    full_tmp = f"{quote_ident(schema)}.{quote_ident(tmp)}"
+
+    statements = [
+        f"DROP TABLE IF EXISTS {full_tmp};",
+        f"""
+        CREATE TABLE {full_tmp} AS
+        WITH pts AS (
+          SELECT DISTINCT ON (s.id_hex)
+            g.i, g.j, g.geom,
+            s.id_hex, s.riqueza_sp, s.cut_reg, s.cut_prov, s.cut_com
+          FROM {full_src} s
+          CROSS JOIN LATERAL ST_HexagonGrid(:size, ST_PointOnSurface(s.geom_3857)) AS g
+          WHERE s.geom_3857 IS NOT NULL
+            AND ST_Intersects(g.geom, ST_PointOnSurface(s.geom_3857))
+          ORDER BY s.id_hex, g.i, g.j
+        )
+        SELECT
+          c.gid, c.gid AS {quote_ident(LEVEL_ID_COL)}, c.id_hex_min, c.n_hex,
+          c.riqueza_sp, c.riqueza_sp_avg, c.cut_reg, c.cut_prov, c.cut_com, c.geom_3857
+        FROM (
+          SELECT
+            (row_number() OVER (ORDER BY i, j))::bigint AS gid,
+            MIN(id_hex) AS id_hex_min,
+            COUNT(*)::integer AS n_hex,
+            MAX(riqueza_sp) AS riqueza_sp,
+            AVG(riqueza_sp)::double precision AS riqueza_sp_avg,
+            mode() WITHIN GROUP (ORDER BY cut_reg) AS cut_reg,
+            mode() WITHIN GROUP (ORDER BY cut_prov) AS cut_prov,
+            mode() WITHIN GROUP (ORDER BY cut_com) AS cut_com,
+            ST_Multi(geom)::geometry(MultiPolygon, 3857) AS geom_3857
+          FROM pts
+          GROUP BY i, j, geom
+        ) c;
+        """,
+        f"ALTER TABLE {full_tmp} ADD PRIMARY KEY (gid);",
+        f"""
+        CREATE INDEX {quote_ident(tmp + "_geom_3857_gix")}
+        ON {full_tmp}
+        USING GIST (geom_3857);
+        """,
+        f"ANALYZE {full_tmp};",
+    ]
+
+    with engine.begin() as conn:
+        for st in statements:
+            params = {"size": float(size)} if ":size" in st else {}
+            conn.execute(text(st), params)
+        n = conn.execute(text(f"SELECT COUNT(*) FROM {full_tmp};")).scalar()
+        # Índice, estadísticas y conteo ya están listos: Tegola solo espera el swap
+        for st in swap_statements(schema, tmp, table):
+            conn.execute(text(st))
+
+    return int(n or 0)
+
+
+def edges_table_name(table: str) -> str:
+    return f"{table}_edges"
+
+
+def build_hex_edges(
+    engine, table: str = "hex5km", schema: str = "public", snap: float = 0.01, id_col: str = "id_hex",
+) -> int:
+    """
+    Construye la red de aristas deduplicada de una grilla hexagonal.
+
+    Cada arista interior aparece una sola vez, con referencias a ambos vecinos
+    por `id_col` (<id_col>_a < <id_col>_b; id_hex en hex5km, id_cell en los
+    niveles agregados). Las aristas exteriores (borde de la grilla) quedan con
+    <id_col>_b = NULL. Se guardan los códigos administrativos de ambos lados
+    para poder filtrar la capa de líneas desde el front.
+
+    Las geometrías se ajustan a una grilla de `snap` metros antes de intersectar
+    los bordes, para que aristas compartidas coincidan exactamente.
+    Retorna la cantidad de aristas generadas.
+    """
+    edges = edges_table_name(table)
+    tmp = f"{edges}_build"
+    full_src = f"{quote_ident(schema)}.{quote_ident(table)}"
+    full_tmp = f"{quote_ident(schema)}.{quote_ident(tmp)}"
+    key = quote_ident(id_col)
+
+    statements = [
+        f"DROP TABLE IF EXISTS {full_tmp};",
+        f"""
+        CREATE TABLE {full_tmp} AS
+        WITH shared AS (
+          SELECT
+            a.{key} AS id_hex_a,
+            b.{key} AS id_hex_b,
+            a.cut_reg AS cut_reg_a, b.cut_reg AS cut_reg_b,
+            a.cut_prov AS cut_prov_a, b.cut_prov AS cut_prov_b,
+            a.cut_com AS cut_com_a, b.cut_com AS cut_com_b,
+            ST_LineMerge(ST_CollectionExtract(ST_Intersection(
+              ST_Boundary(ST_SnapToGrid(a.geom_3857, :snap)),
+              ST_Boundary(ST_SnapToGrid(b.geom_3857, :snap))
+            ), 2)) AS geom
+          FROM {full_src} a
+          JOIN {full_src} b
+            ON a.geom_3857 && b.geom_3857
+           AND a.{key} < b.{key}
+        ),
+        shared_ok AS (
+          SELECT * FROM shared WHERE NOT ST_IsEmpty(geom)
+        ),
+        shared_by_hex AS (
+          SELECT id_hex, ST_Union(geom) AS geom
+          FROM (
+            SELECT id_hex_a AS id_hex, geom FROM shared_ok
+            UNION ALL
+            SELECT id_hex_b AS id_hex, geom FROM shared_ok
+          ) s
+          GROUP BY id_hex
+        ),
+        outer_edges AS (
+          SELECT
+            h.{key} AS id_hex_a,
+            -- CASE WHEN false ... => NULL con el mismo tipo de la columna
+            CASE WHEN false THEN h.{key} END AS id_hex_b,
+            h.cut_reg AS cut_reg_a, CASE WHEN false THEN h.cut_reg END AS cut_reg_b,
+            h.cut_prov AS cut_prov_a, CASE WHEN false THEN h.cut_prov END AS cut_prov_b,
+            h.cut_com AS cut_com_a, CASE WHEN false THEN h.cut_com END AS cut_com_b,
+            ST_LineMerge(ST_CollectionExtract(
+              CASE
+                WHEN s.geom IS NULL THEN ST_Boundary(ST_SnapToGrid(h.geom_3857, :snap))
+                ELSE ST_Difference(ST_Boundary(ST_SnapToGrid(h.geom_3857, :snap)), s.geom)
+              END, 2)) AS geom
+          FROM {full_src} h
+          LEFT JOIN shared_by_hex s ON s.id_hex = h.{key}
+          WHERE h.geom_3857 IS NOT NULL
+        ),
+        all_edges AS (
+          SELECT * FROM shared_ok
+          UNION ALL
+          SELECT * FROM outer_edges
+          WHERE NOT ST_IsEmpty(geom) AND ST_Length(geom) > :snap
+        )
+        SELECT
+          (row_number() OVER (ORDER BY id_hex_a, id_hex_b NULLS LAST))::bigint AS gid,
+          id_hex_a AS {quote_ident(id_col + "_a")},
+          id_hex_b AS {quote_ident(id_col + "_b")},
+          cut_reg_a, cut_reg_b,
+          cut_prov_a, cut_prov_b,
+          cut_com_a, cut_com_b,
+          ST_Multi(geom)::geometry(MultiLineString, 3857) AS geom_3857
+        FROM all_edges;
+        """,
+        f"ALTER TABLE {full_tmp} ADD PRIMARY KEY (gid);",
+        f"""
+        CREATE INDEX {quote_ident(tmp + "_geom_3857_gix")}
+        ON {full_tmp}
+        USING GIST (geom_3857);
+        """,
+        f"ANALYZE {full_tmp};",
+    ]
+
+    with engine.begin() as conn:
+        for st in statements:
+            params = {"snap": float(snap)} if ":snap" in st else {}
+            conn.execute(text(st), params)
+        n = conn.execute(text(f"SELECT COUNT(*) FROM {full_tmp};")).scalar()
+        for st in swap_statements(schema, tmp, edges):
+            conn.execute(text(st))
+
+    return int(n or 0)
+
+
+def build_pyramid_level(engine, size: int, schema: str = "public", source: str = "hex5km"):
+    """
+    Nivel agregado + su red de aristas (las aristas referencian id_cell).
+    Retorna (tabla, celdas, aristas).
+    """
+    table = level_table_name(size)
+    n = build_hex_level(engine, size, schema=schema, source=source)
+    n_edges = build_hex_edges(engine, table=table, schema=schema, id_col=LEVEL_ID_COL)
+    return table, n, n_edges
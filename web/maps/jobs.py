@@ -0,0 +1,349 @@
+"""
+Cola de trabajos de importación respaldada en la base (modelo ImportJob).
+
+- enqueue(): lo usan `import_shp --enqueue`, el admin y POST /api/jobs/
+- claim_next(): toma el siguiente trabajo con FOR UPDATE SKIP LOCKED
+- run_job(): lo ejecuta reportando progreso por etapa (JobReporter) y
+  manteniendo un heartbeat en updated_at (también durante SQL largos)
+- fail_stale_jobs(): marca como fallidos los trabajos running cuyo worker
+  murió sin avisar (p. ej. OOM kill), para que no queden running para siempre
+
+El reporter implementa el mismo protocolo que NullProgress
+(stage/advance/uncancellable), que es lo que recibe ingest_one() cuando se
+corre por CLI.
+"""
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ImportJob
+
+# Throttle de escrituras de progreso / lecturas de cancelación
+REPORT_EVERY_SECONDS = 1.0
+
+# Heartbeat del trabajo en curso (updated_at) y a partir de cuándo se
+# considera que su worker murió
+HEARTBEAT_SECONDS = 30.0
+STALE_AFTER_SECONDS = 300.0
+
+# Parámetros de sesión para las conexiones del worker: menos memoria por
+# consulta, sin workers paralelos y nombre visible en pg_stat_activity.
+WORKER_PG_OPTIONS = (
+    "-c application_name=favex-import-worker "
+    "-c work_mem=16MB "
+    "-c max_parallel_workers_per_gather=0 "
+    "-c statement_timeout=0"
+)
+
+
+class JobCancelled(Exception):
+    """Se pidió cancelar el trabajo en curso."""
+
+
+class NullProgress:
+    """Progreso no-op (ejecución directa por CLI)."""
+
+    def stage(self, name, total=None):
+        pass
+
+    def advance(self, n=1):
+        pass
+
+    def uncancellable(self):
+        pass
+
+
+class JobReporter:
+    """Guarda el progreso por etapa de un ImportJob y revisa si fue cancelado."""
+
+    def __init__(self, job):
+        self.job = job
+        self.stages = {}
+        self._stage = None
+        self._stage_started = None
+        self._rows = 0
+        self._total = None
+        self._last_report = 0.0
+        self._cancellable = True
+
+    def stage(self, name, total=None):
+        self._close_stage()
+        self._stage = name
+        self._stage_started = time.monotonic()
+        self._rows = 0
+        self._total = total
+        self._report(force=True)
+
+    def advance(self, n=1):
+        self._rows += n
+        self._report()
+
+    def uncancellable(self):
+        """Desde aquí se ignoran los pedidos de cancelación (cambios ya publicados)."""
+        self._cancellable = False
+
+    def finish(self, status, message=""):
+        self._close_stage()
+        ImportJob.objects.filter(pk=self.job.pk).update(
+            status=status,
+            message=message,
+            stages=self.stages,
+            progress=1.0 if status == ImportJob.STATUS_DONE else self._progress(),
+            finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+
+    def _progress(self):
+        if self._total:
+            return min(1.0, self._rows / float(self._total))
+        return 0.0
+
+    def _rate(self):
+        elapsed = time.monotonic() - (self._stage_started or time.monotonic())
+        return (self._rows / elapsed) if elapsed > 0 and self._rows else None
+
+    def _close_stage(self):
+        if self._stage is None:
+            return
+        seconds = time.monotonic() - self._stage_started
+        self.stages[self._stage] = {
+            "rows": self._rows,
+            "total": self._total,
+            "seconds": round(seconds, 3),
+            "rows_per_s": round(self._rows / seconds, 1) if seconds > 0 and self._rows else None,
+        }
+        self._stage = None
+
+    def _report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_report < REPORT_EVERY_SECONDS:
+            return
+        self._last_report = now
+
+        ImportJob.objects.filter(pk=self.job.pk).update(
+            stage=self._stage or "",
+            stages=self.stages,
+            progress=self._progress(),
+            rows_done=self._rows,
+            rows_total=self._total,
+            rows_per_s=self._rate(),
+            updated_at=timezone.now(),
+        )
+        if self._cancellable and ImportJob.objects.filter(pk=self.job.pk, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def enqueue(kind, params=None):
+    if kind not in dict(ImportJob.KIND_CHOICES):
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    return ImportJob.objects.create(kind=kind, params=params or {})
+
+
+def request_cancel(job_id):
+    """
+    Pide cancelar un trabajo. Si todavía está en cola se cancela de inmediato;
+    si está corriendo, el worker lo corta en el próximo reporte de progreso
+    (salvo que ya esté publicando sus cambios; ver JobReporter.uncancellable).
+    """
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update().get(pk=job_id)
+        if job.status == ImportJob.STATUS_QUEUED:
+            job.status = ImportJob.STATUS_CANCELLED
+            job.finished_at = timezone.now()
+        job.cancel_requested = True
+        job.save()
+    return job
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next():
+    """Marca como running el trabajo en cola más antiguo (o None si no hay)."""
+    with transaction.atomic():
+        job = (
+            ImportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ImportJob.STATUS_QUEUED)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ImportJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.worker = worker_id()
+        job.save(update_fields=["status", "started_at", "worker", "updated_at"])
+    return job
+
+
+def fail_stale_jobs(stale_after=STALE_AFTER_SECONDS):
+    """
+    Marca como fallidos los trabajos running sin heartbeat hace más de
+    `stale_after` segundos. No se reencolan: si el worker murió por memoria,
+    volver a correrlos lo mataría de nuevo. Retorna los ids afectados.
+    """
+    limit = timezone.now() - timedelta(seconds=stale_after)
+    failed = []
+    with transaction.atomic():
+        stale = (
+            ImportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ImportJob.STATUS_RUNNING, updated_at__lt=limit)
+        )
+        for job in stale:
+            job.status = ImportJob.STATUS_FAILED
+            job.message = (
+                f"El worker {job.worker or '?'} dejó de responder "
+                f"(sin heartbeat desde {job.updated_at.isoformat()})."
+            )
+            job.finished_at = timezone.now()
+            job.save(update_fields=["status", "message", "finished_at", "updated_at"])
+            failed.append(job.pk)
+    return failed
+
+
+class _Heartbeat:
+    """Hilo que actualiza updated_at del trabajo cada HEARTBEAT_SECONDS."""
+
+    def __init__(self, job, every=HEARTBEAT_SECONDS):
+        self.job = job
+        self.every = every
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"favex-job-{job.pk}-heartbeat", daemon=True)
+
+    def _run(self):
+        try:
+            while not self._done.wait(self.every):
+                ImportJob.objects.filter(pk=self.job.pk, status=ImportJob.STATUS_RUNNING).update(
+                    updated_at=timezone.now()
+                )
+        finally:
+            # Conexión propia del hilo
+            connection.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+
+def _worker_engine(database):
+    from sqlalchemy import create_engine
+
+    from maps.management.commands.import_shp import sqlalchemy_url_from_django
+
+    return create_engine(
+        sqlalchemy_url_from_django(database),
+        future=True,
+        connect_args={"options": WORKER_PG_OPTIONS},
+    )
+
+
+def _run_import_shp(job, reporter):
+    from pathlib import Path
+
+    from maps.management.commands.import_shp import ensure_postgis, ingest_one
+
+    p = job.params
+    engine = _worker_engine(p.get("database", "default"))
+    if not p.get("no_postgis_extension"):
+        ensure_postgis(engine)
+    out_sql = p.get("out_sql", "favex_sql")
+    status, msg = ingest_one(
+        engine=engine,
+        path=Path(p["shp"]),
+        schema=p.get("schema", "public"),
+        table_prefix=p.get("table_prefix", ""),
+        if_exists=p.get("if_exists", "append"),
+        target_srid=p.get("target_srid"),
+        out_sql_dir=Path(out_sql) if out_sql else None,
+        progress=reporter,
+    )
+    return msg
+
+
+def _run_build_hex_pyramid(job, reporter):
+    from .datasync import notify_table_change
+    from .hexgrid import PYRAMID_LEVELS, build_hex_edges, build_pyramid_level, edges_table_name
+    from .zoombands import ZOOM_BAND_LAYERS, build_zoom_bands, zbands_table_name
+
+    p = job.params
+    schema = p.get("schema", "public")
+    source = p.get("source", "hex5km")
+    levels = sorted(set(p.get("levels") or PYRAMID_LEVELS))
+    engine = _worker_engine(p.get("database", "default"))
+
+    out = []
+    if not p.get("skip_source_edges"):
+        # Igual que build_hex_pyramid: <source>_edges y sus bandas de zoom
+        edges = edges_table_name(source)
+        band_layers = [name for name, spec in ZOOM_BAND_LAYERS.items() if spec["source"] == edges]
+        reporter.stage("edges", total=1 + len(band_layers))
+        n_edges = build_hex_edges(engine, table=source, schema=schema)
+        notify_table_change(engine, edges, schema=schema)
+        reporter.advance(1)
+        for name in band_layers:
+            build_zoom_bands(engine, name, schema=schema)
+            notify_table_change(engine, zbands_table_name(name), schema=schema)
+            reporter.advance(1)
+        out.append(f"{edges}={n_edges}")
+
+    reporter.stage("levels", total=len(levels))
+    for size in levels:
+        table, n, _ = build_pyramid_level(engine, size, schema=schema, source=source)
+        notify_table_change(engine, table, schema=schema)
+        notify_table_change(engine, edges_table_name(table), schema=schema)
+        out.append(f"{table}={n}")
+        reporter.advance(1)
+    return "Tablas: " + ", ".join(out)
+
+
+RUNNERS = {
+    ImportJob.KIND_IMPORT_SHP: _run_import_shp,
+    ImportJob.KIND_BUILD_HEX_PYRAMID: _run_build_hex_pyramid,
+}
+
+
+def run_job(job):
+    """Ejecuta `job` (ya marcado running) y deja el estado final en la base."""
+    reporter = JobReporter(job)
+    try:
+        with _Heartbeat(job):
+            msg = RUNNERS[job.kind](job, reporter)
+    except JobCancelled:
+        reporter.finish(ImportJob.STATUS_CANCELLED, "Cancelado; lo que no alcanzó a publicarse quedó sin cambios.")
+        return ImportJob.STATUS_CANCELLED
+    except Exception as e:
+        reporter.finish(ImportJob.STATUS_FAILED, f"{type(e).__name__}: {e}")
+        return ImportJob.STATUS_FAILED
+    reporter.finish(ImportJob.STATUS_DONE, msg or "")
+    return ImportJob.STATUS_DONE
+
+
+def job_as_dict(job):
+    return {
+        "id": job.pk,
+        "kind": job.kind,
+        "params": job.params,
+        "status": job.status,
+        "cancel_requested": job.cancel_requested,
+        "stage": job.stage,
+        "stages": job.stages,
+        "progress": job.progress,
+        "rows_done": job.rows_done,
+        "rows_total": job.rows_total,
+        "rows_per_s": job.rows_per_s,
+        "message": job.message,
+        "worker": job.worker,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
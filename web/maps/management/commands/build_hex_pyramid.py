@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from sqlalchemy import create_engine
+
+from maps.datasync import notify_table_change
+from maps.hexgrid import PYRAMID_LEVELS, build_hex_edges, build_pyramid_level, edges_table_name
+from maps.management.commands.import_shp import sqlalchemy_url_from_django, table_exists
+from maps.zoombands import ZOOM_BAND_LAYERS, build_zoom_bands, zbands_table_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Construye la pirámide de niveles agregados de la grilla hexagonal "
+        "(hex20km, hex80km, ...) a partir de hex5km para zooms bajos, y la red "
+        "de aristas de la grilla base (hex5km_edges) con sus bandas de zoom."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--schema", default="public", help="Schema (default: public)")
+        parser.add_argument("--source", default="hex5km", help="Tabla base de la grilla (default: hex5km)")
+        parser.add_argument(
+            "--levels", type=int, nargs="+", default=list(PYRAMID_LEVELS),
+            help="Tamaños de celda en metros (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--skip-source-edges", action="store_true",
+            help="No reconstruye <source>_edges ni sus bandas de zoom",
+        )
+        parser.add_argument("--database", default="default", help="Alias en settings.DATABASES (default: default)")
+
+    def handle(self, *args, **options):
+        schema = options["schema"]
+        source = options["source"]
+        levels = sorted(set(options["levels"]))
+
+        engine = create_engine(sqlalchemy_url_from_django(options["database"]), future=True)
+
+        if not table_exists(engine, schema, source):
+            raise CommandError(f"No existe {schema}.{source}; importa la grilla primero.")
+
+        # Aristas de la grilla base (Tegola sirve z>=7 desde <source>_edges_zbands);
+        # hasta ahora solo las construía import_shp al importar la grilla
+        if not options["skip_source_edges"]:
+            edges = edges_table_name(source)
+            n_edges = build_hex_edges(engine, table=source, schema=schema)
+            notify_table_change(engine, edges, schema=schema)
+            self.stdout.write(self.style.SUCCESS(f"{schema}.{source} -> {schema}.{edges} (aristas={n_edges})"))
+            for layer, spec in ZOOM_BAND_LAYERS.items():
+                if spec["source"] != edges:
+                    continue
+                n = build_zoom_bands(engine, layer, schema=schema)
+                notify_table_change(engine, zbands_table_name(layer), schema=schema)
+                self.stdout.write(self.style.SUCCESS(
+                    f"{schema}.{edges} -> {schema}.{zbands_table_name(layer)} (filas={n})"
+                ))
+
+        for size in levels:
+            if size <= 0:
+                raise CommandError(f"Tamaño de celda inválido: {size}")
+            table, n, n_edges = build_pyramid_level(engine, size, schema=schema, source=source)
+            notify_table_change(engine, table, schema=schema)
+            notify_table_change(engine, edges_table_name(table), schema=schema)
+            self.stdout.write(self.style.SUCCESS(
+                f"{schema}.{source} -> {schema}.{table} (size={size} m, celdas={n}); "
+                f"{schema}.{edges_table_name(table)} (aristas={n_edges})"
+            ))
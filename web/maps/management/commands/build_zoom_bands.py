@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+from sqlalchemy import create_engine
+
+from maps.datasync import notify_table_change
+from maps.management.commands.import_shp import sqlalchemy_url_from_django, table_exists
+from maps.zoombands import (
+    DEFAULT_PX,
+    ZOOM_BAND_LAYERS,
+    build_zoom_bands,
+    describe_bands,
+    zbands_table_name,
+    zoom_report,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Precalcula geometrías simplificadas por banda de zoom (tolerancia derivada del "
+        "extent y tamaño de pixel del tile) y reporta vértices/bytes por zoom antes y después."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--layer", nargs="+", choices=sorted(ZOOM_BAND_LAYERS), default=sorted(ZOOM_BAND_LAYERS),
+            help="Capas a procesar (default: todas)",
+        )
+        parser.add_argument("--schema", default="public", help="Schema (default: public)")
+        parser.add_argument("--px", type=float, default=DEFAULT_PX, help="Tolerancia en pixeles del tile (default: 0.5)")
+        parser.add_argument("--band-width", type=int, default=2, help="Zooms por banda (default: 2)")
+        parser.add_argument("--extent", type=int, default=None, help="Sobrescribe el extent de las capas")
+        parser.add_argument("--center", default="-70.65,-33.45", help="lon,lat del tile de muestra para el reporte")
+        parser.add_argument("--dry-run", action="store_true", help="Solo muestra las tolerancias por banda")
+        parser.add_argument("--report-only", action="store_true", help="No reconstruye; solo reporta")
+        parser.add_argument("--no-report", action="store_true", help="No genera el reporte por zoom")
+        parser.add_argument("--database", default="default", help="Alias en settings.DATABASES (default: default)")
+
+    def handle(self, *args, **options):
+        schema = options["schema"]
+        px = options["px"]
+        width = options["band_width"]
+        if px <= 0 or width <= 0:
+            raise CommandError("--px y --band-width deben ser positivos")
+        try:
+            center = tuple(float(v) for v in options["center"].split(","))
+        except ValueError:
+            center = ()
+        if len(center) != 2:
+            raise CommandError("--center debe ser lon,lat")
+
+        extent = options["extent"]
+
+        for layer in options["layer"]:
+            spec = ZOOM_BAND_LAYERS[layer]
+            self.stdout.write(f"{layer} (source={spec['source']}, extent={extent or spec['extent']})")
+            for z_min, z_max, tol, grid in describe_bands(layer, px, width, extent):
+                if tol is None:
+                    self.stdout.write(f"  z{z_min}-{z_max}: geometría completa (grilla={grid or '-'})")
+                else:
+                    self.stdout.write(f"  z{z_min}-{z_max}: tolerancia={tol:.2f} m grilla={grid:.2f} m")
+
+        if options["dry_run"]:
+            return
+
+        engine = create_engine(sqlalchemy_url_from_django(options["database"]), future=True)
+
+        for layer in options["layer"]:
+            spec = ZOOM_BAND_LAYERS[layer]
+            if not table_exists(engine, schema, spec["source"]):
+                self.stdout.write(self.style.WARNING(f"No existe {schema}.{spec['source']}; omito {layer}."))
+                continue
+
+            table = zbands_table_name(layer)
+            if not options["report_only"]:
+                n = build_zoom_bands(engine, layer, schema=schema, px=px, width=width, extent=extent)
+                notify_table_change(engine, table, schema=schema)
+                self.stdout.write(self.style.SUCCESS(f"{schema}.{spec['source']} -> {schema}.{table} (filas={n})"))
+
+            if options["no_report"]:
+                continue
+            if not table_exists(engine, schema, table):
+                self.stdout.write(self.style.WARNING(f"No existe {schema}.{table}; no hay reporte."))
+                continue
+
+            self.stdout.write(f"Reporte {layer} (tile que contiene {center[0]},{center[1]}):")
+            self.stdout.write("  zoom  tile            vtx_antes  vtx_despues  bytes_antes  bytes_despues")
+            for z, x, y, vb, va, bb, ba in zoom_report(engine, layer, schema=schema, center=center, extent=extent):
+                self.stdout.write(
+                    f"  {z:>4}  {f'{x}/{y}':<14}  {vb:>9}  {va:>11}  {bb:>11}  {ba:>13}"
+                )
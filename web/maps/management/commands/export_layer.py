@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from maps.export import (
+    DEFAULT_CHUNK_SIZE,
+    EXPORT_FORMATS,
+    EXPORT_LAYERS,
+    ExportError,
+    build_query,
+    iter_chunks,
+    parse_bbox,
+    write_export,
+)
+
+
+class Command(BaseCommand):
+    help = "Exporta una capa (hex5km, formaciones, ...) a NDJSON / FlatGeobuf / GeoParquet con cursor de servidor."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--layer", required=True, choices=sorted(EXPORT_LAYERS), help="Capa a exportar")
+        parser.add_argument("--format", default="fgb", choices=sorted(EXPORT_FORMATS), help="Formato (default: fgb)")
+        parser.add_argument("--out", required=True, help="Archivo de salida")
+        parser.add_argument("--cut-reg", default=None, help="Filtrar por cut_reg")
+        parser.add_argument("--cut-prov", default=None, help="Filtrar por cut_prov")
+        parser.add_argument("--cut-com", default=None, help="Filtrar por cut_com")
+        parser.add_argument("--bbox", default=None, help="minx,miny,maxx,maxy en EPSG:4326")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Filas por bloque")
+        parser.add_argument("--no-spatial-index", action="store_true", help="FlatGeobuf sin índice espacial")
+
+    def handle(self, *args, **options):
+        layer = options["layer"]
+        fmt = options["format"]
+        out = Path(options["out"])
+        filters = {
+            "cut_reg": options["cut_reg"],
+            "cut_prov": options["cut_prov"],
+            "cut_com": options["cut_com"],
+        }
+
+        try:
+            bbox = parse_bbox(options["bbox"])
+            sql, params = build_query(layer, fmt, filters=filters, bbox=bbox)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            n = write_export(
+                iter_chunks(sql, params, chunk_size=options["chunk_size"]),
+                fmt,
+                out,
+                spatial_index=not options["no_spatial_index"],
+            )
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"{layer} -> {out} ({fmt}, rows={n})"))
@@ -16,11 +16,22 @@ from django.core.management.base import BaseCommand, CommandError
 from sqlalchemy import create_engine, text
 from geoalchemy2 import Geometry
 
+from maps.datasync import notify_table_change
+from maps.hexgrid import PYRAMID_LEVELS, build_hex_edges, build_pyramid_level, edges_table_name
+from maps.jobs import NullProgress, enqueue
+from maps.zoombands import ZOOM_BAND_LAYERS, build_zoom_bands, zbands_table_name
+
 
 VECTOR_EXTS = {".shp", ".geojson", ".json", ".gpkg", ".kml", ".kmz", ".gml", ".zip"}
 
 RESERVED_COLS = {"gid", "geom"}
 
+LOAD_CHUNKSIZE = 5000
+
+# Tablas de grilla hexagonal: al importarlas se construye su red de aristas
+# y los niveles agregados de la pirámide (hexgrid.PYRAMID_LEVELS)
+HEX_GRID_TABLES = {"hex5km"}
+
 def table_exists(engine, schema: str, table: str) -> bool:
     sql = """
     SELECT EXISTS (
@@ -285,6 +296,54 @@ def geometry_validity_stats(engine, schema: str, table: str, geom_col: str = "ge
         row = conn.execute(text(sql)).mappings().first()
     return row
 
+def build_table_name(table: str) -> str:
+    return f"{table}_build"
+
+
+def publish_build_table(engine, schema: str, build: str, table: str, append: bool, columns):
+    """
+    Publica <tabla>_build en `table` en una sola transacción:
+    - replace (o si `table` no existe): DROP de la tabla + RENAME de la nueva,
+      renombrando también sus índices y la secuencia de gid
+    - append: INSERT de las filas nuevas (sin gid) y DROP de la tabla build
+    """
+    full_table = f"{quote_ident(schema)}.{quote_ident(table)}"
+    full_build = f"{quote_ident(schema)}.{quote_ident(build)}"
+
+    with engine.begin() as conn:
+        build_cols = set(conn.execute(text("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = :schema AND table_name = :table
+        """), {"schema": schema, "table": build}).scalars())
+        exists = conn.execute(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": full_table}).scalar()
+
+        if append and exists:
+            cols = [c for c in columns if c in build_cols]
+            if "geom_3857" in build_cols:
+                conn.execute(text(
+                    f"ALTER TABLE {full_table} ADD COLUMN IF NOT EXISTS geom_3857 geometry(MultiPolygon, 3857);"
+                ))
+                cols.append("geom_3857")
+            col_list = ", ".join(quote_ident(c) for c in cols)
+            conn.execute(text(
+                f"INSERT INTO {full_table} ({col_list}) SELECT {col_list} FROM {full_build} ORDER BY gid;"
+            ))
+            conn.execute(text(f"DROP TABLE {full_build};"))
+            return
+
+        conn.execute(text(f"DROP TABLE IF EXISTS {full_table} CASCADE;"))
+        conn.execute(text(f"ALTER TABLE {full_build} RENAME TO {quote_ident(table)};"))
+        for suffix in ("_pkey", "_geom_gix", "_geom_3857_gix"):
+            conn.execute(text(
+                f"ALTER INDEX IF EXISTS {quote_ident(schema)}.{quote_ident(build + suffix)} "
+                f"RENAME TO {quote_ident(table + suffix)};"
+            ))
+        conn.execute(text(
+            f"ALTER SEQUENCE IF EXISTS {quote_ident(schema)}.{quote_ident(build + '_gid_seq')} "
+            f"RENAME TO {quote_ident(table + '_gid_seq')};"
+        ))
+
+
 def ingest_one(
     engine,
     path: Path,
@@ -294,7 +353,12 @@ def ingest_one(
     target_srid: Optional[int],
     out_sql_dir: Optional[Path],
     table_name_override: Optional[str] = None,
+    progress=None,
 ):
+    # progress: objeto con stage(name, total=None) / advance(n) (ver maps.jobs)
+    progress = progress or NullProgress()
+
+    progress.stage("read")
     gdf = read_vector(path)
 
     if gdf.empty:
@@ -316,16 +380,21 @@ def ingest_one(
         base = slug_table_name(path.stem)
         table = slug_table_name(f"{table_prefix}{base}")
 
+    progress.stage("create")
     create_sql = build_create_table_sql(schema, table, gdf, geom_type, srid)
 
     if out_sql_dir is not None:
         out_sql_dir.mkdir(parents=True, exist_ok=True)
         (out_sql_dir / f"{schema}.{table}.sql").write_text(create_sql, encoding="utf-8")
 
+    # Se carga en <tabla>_build y se publica en una sola transacción (ver
+    # publish_build_table): si el trabajo se cancela o falla antes, la tabla
+    # destino queda como estaba.
+    build = build_table_name(table)
+    full_build = f"{quote_ident(schema)}.{quote_ident(build)}"
     with engine.begin() as conn:
-        if if_exists == "replace":
-            conn.execute(text(f"DROP TABLE IF EXISTS {quote_ident(schema)}.{quote_ident(table)} CASCADE;"))
-        conn.execute(text(create_sql))
+        conn.execute(text(f"DROP TABLE IF EXISTS {full_build};"))
+        conn.execute(text(build_create_table_sql(schema, build, gdf, geom_type, srid)))
 
     gdf = gdf.copy()
 
@@ -343,23 +412,74 @@ def ingest_one(
         gdf = gdf.drop(columns=[old_geom])
 
     dtype = {"geom": Geometry(geometry_type=geom_type, srid=srid)}
-    gdf.to_postgis(
-        name=table,
-        con=engine,
-        schema=schema,
-        if_exists="append",
-        index=False,
-        dtype=dtype,
-        chunksize=5000,
-    )
-
-    # Repara geometrías con problemas
-    before = geometry_validity_stats(engine, schema, table, geom_col="geom")
-    repair_table_geometries(engine, schema, table, geom_col="geom", snap=1e-9)
-    #after = geometry_validity_stats(engine, schema, table, geom_col="geom")
-
-    # Ejecuta post-SQL para hex5km (solo si existe)
-    st2, msg2 = run_post_sql(engine, schema="public", table=table)
+    try:
+        progress.stage("load", total=len(gdf))
+        # Una sola transacción (como antes), pero por bloques para reportar avance
+        with engine.begin() as conn:
+            for start in range(0, len(gdf), LOAD_CHUNKSIZE):
+                chunk = gdf.iloc[start:start + LOAD_CHUNKSIZE]
+                chunk.to_postgis(
+                    name=build,
+                    con=conn,
+                    schema=schema,
+                    if_exists="append",
+                    index=False,
+                    dtype=dtype,
+                )
+                progress.advance(len(chunk))
+
+        # Repara geometrías con problemas
+        progress.stage("repair")
+        before = geometry_validity_stats(engine, schema, build, geom_col="geom")
+        repair_table_geometries(engine, schema, build, geom_col="geom", snap=1e-9)
+        #after = geometry_validity_stats(engine, schema, build, geom_col="geom")
+
+        # Ejecuta post-SQL para hex5km (solo si existe)
+        progress.stage("post_sql")
+        st2, msg2 = run_post_sql(engine, schema="public", table=build)
+
+        # Desde aquí la tabla destino cambia: las tablas derivadas y el aviso
+        # a los workers tienen que completarse, así que no se corta más.
+        progress.stage("publish")
+        progress.uncancellable()
+        columns = [c for c in gdf.columns if c != "geom"] + ["geom"]
+        publish_build_table(engine, schema, build, table, append=(if_exists == "append"), columns=columns)
+    except BaseException:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {full_build};"))
+        raise
+
+    if if_exists == "append":
+        # La tabla existente puede no tener índice/estadísticas de geom_3857
+        run_post_sql(engine, schema="public", table=table)
+
+    # Aristas deduplicadas para la capa de líneas (hex5km_edges)
+    if table in HEX_GRID_TABLES:
+        progress.stage("edges")
+        build_hex_edges(engine, table=table, schema="public")
+        notify_table_change(engine, edges_table_name(table), schema="public")
+
+        # Niveles agregados (zoom <= 6): si no, quedan con la grilla anterior
+        progress.stage("pyramid", total=len(PYRAMID_LEVELS))
+        for size in PYRAMID_LEVELS:
+            level, _, _ = build_pyramid_level(engine, size, schema="public", source=table)
+            notify_table_change(engine, level, schema="public")
+            notify_table_change(engine, edges_table_name(level), schema="public")
+            progress.advance(1)
+
+    # Geometrías por banda de zoom que sirve Tegola (<capa>_zbands)
+    rebuilt = {table, edges_table_name(table)} if table in HEX_GRID_TABLES else {table}
+    band_layers = [name for name, spec in ZOOM_BAND_LAYERS.items() if spec["source"] in rebuilt]
+    if band_layers:
+        progress.stage("zbands", total=len(band_layers))
+        for name in band_layers:
+            build_zoom_bands(engine, name, schema="public")
+            notify_table_change(engine, zbands_table_name(name), schema="public")
+            progress.advance(1)
+
+    # Avisa a los workers web que la tabla cambió (invalida cachés / ETags)
+    progress.stage("notify")
+    notify_table_change(engine, table, schema=schema)
 
     return ("OK", f"{path.name} -> {schema}.{table} (SRID={srid}, GEOM={geom_type}, rows={len(gdf)})")
 
@@ -414,6 +534,7 @@ class Command(BaseCommand):
         parser.add_argument("--out-sql", default='favex_sql', help="Carpeta donde guardar .sql (opcional)")
         parser.add_argument("--database", default="default", help="Alias en settings.DATABASES (default: default)")
         parser.add_argument("--no-postgis-extension", action="store_true", help="No intenta crear extensión postgis")
+        parser.add_argument("--enqueue", action="store_true", help="Encola el import para import_worker en vez de ejecutarlo aquí")
 
     def handle(self, *args, **options):
         shp = options["shp"]
@@ -423,7 +544,21 @@ class Command(BaseCommand):
         target_srid = options["target_srid"]
         out_sql_dir = Path(options["out_sql"]) if options["out_sql"] else None
         db_alias = options["database"]
-        
+
+        if options["enqueue"]:
+            job = enqueue("import_shp", {
+                "shp": str(Path(shp).resolve()),
+                "schema": schema,
+                "table_prefix": table_prefix,
+                "if_exists": if_exists,
+                "target_srid": target_srid,
+                "out_sql": options["out_sql"],
+                "database": db_alias,
+                "no_postgis_extension": options["no_postgis_extension"],
+            })
+            self.stdout.write(self.style.SUCCESS(f"Import encolado: job #{job.pk} (ver /api/jobs/{job.pk}/)"))
+            return
+
 
         db_url = sqlalchemy_url_from_django(db_alias)
         engine = create_engine(db_url, future=True)
@@ -0,0 +1,51 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from maps.jobs import STALE_AFTER_SECONDS, claim_next, fail_stale_jobs, run_job, worker_id
+from maps.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "Worker de la cola de imports (ImportJob): ejecuta los trabajos encolados con baja prioridad."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll", type=float, default=5.0, help="Segundos entre consultas a la cola (default: 5)")
+        parser.add_argument("--once", action="store_true", help="Procesa los trabajos pendientes y termina")
+        parser.add_argument("--nice", type=int, default=10, help="Incremento de niceness del proceso (default: 10)")
+        parser.add_argument("--max-memory-mb", type=int, default=None, help="Límite de memoria (RLIMIT_AS) en MB")
+        parser.add_argument(
+            "--stale-after", type=float, default=STALE_AFTER_SECONDS,
+            help="Segundos sin heartbeat para dar por muerto un trabajo running (default: %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        if options["nice"]:
+            os.nice(options["nice"])
+        if options["max_memory_mb"]:
+            import resource
+
+            limit = options["max_memory_mb"] * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        self.stdout.write(f"import_worker {worker_id()} escuchando la cola (poll={options['poll']}s)")
+
+        while True:
+            close_old_connections()
+            # Trabajos de workers que murieron sin avisar (p. ej. OOM kill)
+            for pk in fail_stale_jobs(options["stale_after"]):
+                self.stdout.write(self.style.WARNING(f"[job #{pk}] sin heartbeat; marcado como failed"))
+            job = claim_next()
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll"])
+                continue
+
+            self.stdout.write(f"[job #{job.pk}] {job.kind} {job.params}")
+            status = run_job(job)
+            job.refresh_from_db()
+            style = self.style.SUCCESS if status == ImportJob.STATUS_DONE else self.style.WARNING
+            self.stdout.write(style(f"[job #{job.pk}] {status}: {job.message}"))
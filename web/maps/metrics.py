@@ -0,0 +1,23 @@
+"""
+Contadores en memoria por proceso (expuestos en /api/metrics/).
+
+Cada worker lleva sus propios contadores; el pid va en el snapshot para
+poder sumar la flota desde afuera.
+"""
+import os
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(lambda: defaultdict(int))
+
+
+def incr(group: str, name: str, value=1):
+    with _lock:
+        _counters[group][name] += value
+
+
+def snapshot():
+    with _lock:
+        data = {g: dict(c) for g, c in _counters.items()}
+    return {"pid": os.getpid(), "counters": data}
@@ -0,0 +1,99 @@
+import re
+import time
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from . import metrics
+from .responses import choose_encoding, compress
+
+MIN_COMPRESS_BYTES = 512
+# APIs JSON/NDJSON: br o gzip sin relleno (no llevan secretos como el token CSRF)
+COMPRESSIBLE_TYPES = re.compile(r"^application/(json|x-ndjson)")
+# HTML y demás texto (admin, templates con CSRF): solo gzip con el relleno
+# aleatorio de GZipMiddleware como mitigación de BREACH
+PADDED_TYPES = re.compile(r"^text/")
+
+
+class CompressionMiddleware:
+    """
+    Comprime respuestas con brotli o gzip según Accept-Encoding (reemplaza a
+    GZipMiddleware) y mide bytes y CPU por request.
+
+    - Respuestas ya codificadas (p. ej. static_json_response) pasan tal cual.
+    - JSON/NDJSON: br o gzip; las streaming (export NDJSON) con gzip en streaming.
+    - text/*: gzip con max_random_bytes, igual que GZipMiddleware (BREACH).
+    - Server-Timing: cpu (vista + serialización) y compress, en ms.
+    - maps.metrics, grupo "responses.<url_name>": requests, bytes_raw,
+      bytes_sent, cpu_ms, compress_ms.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cpu_start = time.thread_time()
+        response = self.get_response(request)
+        cpu_ms = (time.thread_time() - cpu_start) * 1000.0
+
+        compress_start = time.thread_time()
+        raw_length = self._compress(request, response)
+        compress_ms = (time.thread_time() - compress_start) * 1000.0
+
+        response["Server-Timing"] = f"cpu;dur={cpu_ms:.2f}, compress;dur={compress_ms:.2f}"
+
+        match = getattr(request, "resolver_match", None)
+        group = f"responses.{(match.url_name if match else None) or 'other'}"
+        metrics.incr(group, "requests")
+        metrics.incr(group, "cpu_ms", cpu_ms)
+        metrics.incr(group, "compress_ms", compress_ms)
+        if raw_length is not None:
+            metrics.incr(group, "bytes_raw", raw_length)
+            metrics.incr(group, "bytes_sent", len(response.content))
+        return response
+
+    def _compress(self, request, response):
+        """Comprime `response` in situ. Retorna los bytes sin comprimir (None si es streaming)."""
+        if response.streaming:
+            raw_length = None
+        else:
+            raw_length = getattr(response, "raw_length", len(response.content))
+
+        if response.has_header("Content-Encoding"):
+            return raw_length
+        content_type = response.get("Content-Type", "")
+        padded = bool(PADDED_TYPES.match(content_type))
+        if not padded and not COMPRESSIBLE_TYPES.match(content_type):
+            return raw_length
+        max_random_bytes = GZipMiddleware.max_random_bytes if padded else None
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        # En streaming y en texto solo gzip (compress_sequence/compress_string de Django)
+        encoding = choose_encoding(request, allow_br=not (response.streaming or padded))
+        if encoding is None:
+            return raw_length
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(
+                response.streaming_content, max_random_bytes=max_random_bytes
+            )
+            del response["Content-Length"]
+        else:
+            if raw_length < MIN_COMPRESS_BYTES:
+                return raw_length
+            if padded:
+                compressed = compress_string(response.content, max_random_bytes=max_random_bytes)
+            else:
+                compressed = compress(response.content, encoding)
+            if len(compressed) >= raw_length:
+                return raw_length
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # Igual que GZipMiddleware: el ETag deja de ser fuerte al comprimir
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return raw_length
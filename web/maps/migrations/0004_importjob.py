@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maps', '0003_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('import_shp', 'Importar capa (import_shp)'), ('build_hex_pyramid', 'Construir pirámide hex (build_hex_pyramid)')], max_length=32)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'En cola'), ('running', 'Ejecutando'), ('done', 'Terminado'), ('failed', 'Falló'), ('cancelled', 'Cancelado')], db_index=True, default='queued', max_length=16)),
+                ('cancel_requested', models.BooleanField(default=False)),
+                ('stage', models.CharField(blank=True, default='', max_length=32)),
+                ('stages', models.JSONField(blank=True, default=dict)),
+                ('progress', models.FloatField(default=0.0)),
+                ('rows_done', models.BigIntegerField(default=0)),
+                ('rows_total', models.BigIntegerField(blank=True, null=True)),
+                ('rows_per_s', models.FloatField(blank=True, null=True)),
+                ('message', models.TextField(blank=True, default='')),
+                ('worker', models.CharField(blank=True, default='', max_length=128)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
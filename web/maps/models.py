@@ -1 +1,71 @@
 from django.contrib.gis.db import models as gis_models
+from django.db import models
+
+
+class DataVersion(models.Model):
+    """
+    Contador de versión por tabla de datos (hex5km, comunas, formaciones...).
+
+    Lo incrementa import_shp (y build_hex_pyramid) en la misma transacción que
+    el NOTIFY, así todos los workers derivan ETags/keys de caché consistentes.
+    """
+    table_name = models.CharField(max_length=63, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.table_name}@{self.version}"
+
+
+class ImportJob(models.Model):
+    """
+    Trabajo de importación/refresco en cola (lo ejecuta manage.py import_worker).
+
+    El worker toma los trabajos con SELECT ... FOR UPDATE SKIP LOCKED, así
+    pueden correr varios workers sin pisarse.
+    """
+    KIND_IMPORT_SHP = "import_shp"
+    KIND_BUILD_HEX_PYRAMID = "build_hex_pyramid"
+    KIND_CHOICES = [
+        (KIND_IMPORT_SHP, "Importar capa (import_shp)"),
+        (KIND_BUILD_HEX_PYRAMID, "Construir pirámide hex (build_hex_pyramid)"),
+    ]
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CANCELLED = "cancelled"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "En cola"),
+        (STATUS_RUNNING, "Ejecutando"),
+        (STATUS_DONE, "Terminado"),
+        (STATUS_FAILED, "Falló"),
+        (STATUS_CANCELLED, "Cancelado"),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    cancel_requested = models.BooleanField(default=False)
+
+    # Progreso
+    stage = models.CharField(max_length=32, blank=True, default="")
+    stages = models.JSONField(default=dict, blank=True)   # etapa -> {rows, total, seconds, rows_per_s}
+    progress = models.FloatField(default=0.0)            # 0..1 de la etapa actual
+    rows_done = models.BigIntegerField(default=0)
+    rows_total = models.BigIntegerField(null=True, blank=True)
+    rows_per_s = models.FloatField(null=True, blank=True)
+    message = models.TextField(blank=True, default="")
+
+    worker = models.CharField(max_length=128, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} [{self.status}]"
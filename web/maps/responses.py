@@ -0,0 +1,140 @@
+"""
+Capa de respuestas para las APIs del mapa.
+
+- dumps(): JSON con orjson si está instalado (fallback a json de la stdlib)
+- FastJsonResponse: reemplazo directo de JsonResponse usando dumps()
+- rows_response(): filas del cursor como [{...}, ...] en un solo dumps()
+- static_json_response(): respuestas que no cambian en la vida del proceso
+  (mvt_style); el cuerpo y sus variantes br/gzip se calculan una sola vez
+- choose_encoding()/compress(): negociación br/gzip que usa también
+  maps.middleware.CompressionMiddleware para el resto de las respuestas
+"""
+import gzip
+import hashlib
+import json
+import threading
+from decimal import Decimal
+
+from django.http import HttpResponse, HttpResponseNotModified
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende del entorno
+    brotli = None
+
+JSON_CONTENT_TYPE = "application/json"
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5           # respuestas dinámicas
+BROTLI_QUALITY_STATIC = 11   # respuestas precomprimidas (se comprimen una vez)
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Objeto no serializable: {type(obj).__name__}")
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJsonResponse(HttpResponse):
+    """Como JsonResponse (safe=False), pero serializando con dumps()."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", JSON_CONTENT_TYPE)
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def rows_response(cursor, keys, **kwargs):
+    """
+    Respuesta JSON [{key: valor}, ...] con las filas restantes de `cursor`.
+    Se arman los dicts y se serializa todo en una sola llamada a dumps():
+    con orjson es bastante más rápido que serializar valor por valor.
+    """
+    return FastJsonResponse([dict(zip(keys, r)) for r in cursor.fetchall()], **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Compresión
+# ---------------------------------------------------------------------------
+
+def choose_encoding(request, allow_br=True):
+    """br si el cliente lo acepta y brotli está instalado; si no gzip; si no None."""
+    accept = request.headers.get("Accept-Encoding", "")
+    offered = {}
+    for part in accept.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            offered[token.lower()] = q
+    if allow_br and brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str, static=False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY_STATIC if static else BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=9 if static else GZIP_LEVEL, mtime=0)
+    return body
+
+
+_static_lock = threading.Lock()
+_static = {}   # key -> {"etag": ..., None: cuerpo, "br": ..., "gzip": ...}
+
+
+def static_json_response(request, key, build):
+    """
+    Respuesta JSON que depende solo de `key` (config del proceso).
+
+    build() se llama una sola vez por key; las variantes comprimidas se
+    calculan con el máximo nivel la primera vez que se piden y quedan en memoria.
+    """
+    with _static_lock:
+        entry = _static.get(key)
+    if entry is None:
+        body = dumps(build())
+        entry = {
+            None: body,
+            "etag": '"%s"' % hashlib.sha1(body).hexdigest(),
+        }
+        with _static_lock:
+            entry = _static.setdefault(key, entry)
+
+    # ETag fuerte distinto por content-coding (RFC 9110 8.8.3): "<sha1>-br"
+    encoding = choose_encoding(request)
+    etag = entry["etag"] if encoding is None else f'{entry["etag"][:-1]}-{encoding}"'
+
+    if etag in request.headers.get("If-None-Match", ""):
+        return HttpResponseNotModified(headers={"ETag": etag, "Vary": "Accept-Encoding"})
+
+    if encoding not in entry:
+        compressed = compress(entry[None], encoding, static=True)
+        with _static_lock:
+            entry.setdefault(encoding, compressed)
+
+    response = HttpResponse(entry[encoding], content_type=JSON_CONTENT_TYPE)
+    response["ETag"] = etag
+    response["Vary"] = "Accept-Encoding"
+    if encoding:
+        response["Content-Encoding"] = encoding
+    # Para las métricas de CompressionMiddleware (bytes sin comprimir)
+    response.raw_length = len(entry[None])
+    return response
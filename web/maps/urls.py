@@ -5,8 +5,13 @@ urlpatterns = [
     path("", views.index, name="index"),
     path("map", views.map, name="map"),
     path("mvt/style.json", views.mvt_style, name="mvt_style"),
-    path("api/regions/", views.regions),
-    path("api/provinces/", views.provinces),
-    path("api/communes/", views.communes),
+    path("api/regions/", views.regions, name="regions"),
+    path("api/provinces/", views.provinces, name="provinces"),
+    path("api/communes/", views.communes, name="communes"),
     path("api/hex-formaciones/", views.hex_formaciones, name="hex_formaciones"),
+    path("api/export/<str:layer>/", views.export_layer, name="export_layer"),
+    path("api/metrics/", views.metrics_view, name="metrics"),
+    path("api/jobs/", views.jobs, name="jobs"),
+    path("api/jobs/<int:job_id>/", views.job_detail, name="job_detail"),
+    path("api/jobs/<int:job_id>/cancel/", views.job_cancel, name="job_cancel"),
 ]
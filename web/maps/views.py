@@ -1,17 +1,37 @@
 import json
 from django.shortcuts import render
-from django.http import JsonResponse
-from django.views.decorators.http import require_GET
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET, require_POST
 from django.contrib.gis.db.models.functions import AsGeoJSON
 from django.db import connection
 import os, hashlib
 
+from . import metrics
+from .admission import admission_control
+from .datasync import cached_json
+from .hexgrid import LEVEL_ID_COL, PYRAMID_LEVELS, level_table_name
+from .jobs import enqueue, job_as_dict, request_cancel
+from .models import ImportJob
+from .responses import FastJsonResponse, rows_response, static_json_response
+from .export import (
+    EXPORT_FORMATS,
+    ExportError,
+    ExportUnavailable,
+    build_query,
+    iter_chunks,
+    iter_ndjson,
+    parse_bbox,
+    spool_export,
+)
+
 def index(request):
     return render(request, "index.html")
 
 def map(request):
     return render(request, "map.html")
 
+@cached_json("comunas")
+@admission_control("admin_lists")
 def regions(request):
     with connection.cursor() as cur:
         cur.execute("""
@@ -21,9 +41,10 @@ def regions(request):
               AND region IS NOT NULL AND region <> ''
             ORDER BY region
         """)
-        data = [{"code": r[0], "name": r[1]} for r in cur.fetchall()]
-    return JsonResponse(data, safe=False)
+        return rows_response(cur, ["code", "name"])
 
+@cached_json("comunas", params=("cut_reg",))
+@admission_control("admin_lists")
 def provinces(request):
     cut_reg = request.GET.get("cut_reg", "")
     with connection.cursor() as cur:
@@ -35,9 +56,10 @@ def provinces(request):
               AND provincia IS NOT NULL AND provincia <> ''
             ORDER BY provincia
         """, [cut_reg])
-        data = [{"code": r[0], "name": r[1]} for r in cur.fetchall()]
-    return JsonResponse(data, safe=False)
+        return rows_response(cur, ["code", "name"])
 
+@cached_json("comunas", params=("cut_reg", "cut_prov"))
+@admission_control("admin_lists")
 def communes(request):
     cut_reg = request.GET.get("cut_reg", "")
     cut_prov = request.GET.get("cut_prov", "")
@@ -51,13 +73,20 @@ def communes(request):
               AND comuna IS NOT NULL AND comuna <> ''
             ORDER BY comuna
         """, [cut_reg, cut_prov])
-        data = [{"code": r[0], "name": r[1]} for r in cur.fetchall()]
-    return JsonResponse(data, safe=False)
+        return rows_response(cur, ["code", "name"])
 
 def mvt_style(request):
     tegola_public = os.environ.get("TEGOLA_PUBLIC_URL", "http://localhost:9090")
     map_name = os.environ.get("TEGOLA_MAP_NAME", "base")
-    layer_name = os.environ.get("TEGOLA_LAYER_NAME", "hex5km")
+    fill_map_name = os.environ.get("TEGOLA_FILL_MAP_NAME", "hexfill")
+    # El estilo solo depende de la config: se arma y comprime una vez por proceso
+    return static_json_response(
+        request,
+        ("mvt_style", tegola_public, map_name, fill_map_name),
+        lambda: _mvt_style_data(tegola_public, map_name, fill_map_name),
+    )
+
+def _mvt_style_data(tegola_public, map_name, fill_map_name):
 
     formaciones = [
       "Bosque caducifolio andino del Bíobío",
@@ -160,10 +189,18 @@ def mvt_style(request):
                 "minzoom": 0,
                 "maxzoom": 14,
             },
+            # Polígonos de la grilla (relleno de map.html). Ninguna capa del
+            # estilo la usa, así que sus tiles solo se piden si se agrega una.
+            "tegola_fill": {
+                "type": "vector",
+                "tiles": [f"{tegola_public}/maps/{fill_map_name}/{{z}}/{{x}}/{{y}}.pbf"],
+                "minzoom": 0,
+                "maxzoom": 14,
+            },
         },
         "layers": [
             {"id": "osm-base", "type": "raster", "source": "osm"},
-            { "id":"hex5km-line", "type":"line", "source":"tegola", "source-layer":"hex5km",
+            { "id":"hex5km-line", "type":"line", "source":"tegola", "source-layer":"hex5km_edges",
               "paint":{"line-width":1, "line-opacity":0.4}
             },
             {
@@ -180,30 +217,44 @@ def mvt_style(request):
 
         ]
     }
-    return JsonResponse(style)
+    return style
 
 def _stable_hsl(name: str) -> str:
     h = int(hashlib.md5(name.encode("utf-8")).hexdigest()[:8], 16) % 360
     return f"hsl({h}, 70%, 50%)"
 
+# Niveles agregados de la pirámide (zoom <= 6): se consultan por id_cell
+HEX_LEVELS = {level_table_name(size) for size in PYRAMID_LEVELS}
+
 @require_GET
+@cached_json("hex5km", *sorted(HEX_LEVELS), "formaciones", params=("nivel", "id_hex", LEVEL_ID_COL))
+@admission_control("hex_formaciones")
 def hex_formaciones(request):
     """
     GET /api/hex-formaciones/?id_hex=123
-    Retorna lista de formaciones que intersectan el hex, ordenadas por área de intersección (km2).
+    GET /api/hex-formaciones/?nivel=hex20km&id_cell=45   (celdas agregadas, zoom <= 6)
+    Retorna lista de formaciones que intersectan el hex (o la celda agregada),
+    ordenadas por área de intersección (km2).
     """
-    id_hex = request.GET.get("id_hex")
-    if not id_hex:
-        return JsonResponse({"ok": False, "error": "Falta parámetro id_hex"}, status=400)
+    nivel = request.GET.get("nivel") or "hex5km"
+    if nivel == "hex5km":
+        key, id_value = "id_hex", request.GET.get("id_hex")
+    elif nivel in HEX_LEVELS:
+        key, id_value = LEVEL_ID_COL, request.GET.get(LEVEL_ID_COL)
+    else:
+        return JsonResponse({"ok": False, "error": f"Nivel desconocido: {nivel}"}, status=400)
+    if not id_value:
+        return JsonResponse({"ok": False, "error": f"Falta parámetro {key}"}, status=400)
 
     # Ajusta nombres de campos según tu esquema:
-    # - hex5km: geom_3857, id_hex
+    # - hex5km: geom_3857, id_hex / hex20km, hex80km: geom_3857, id_cell
     # - formaciones: geom_3857, gid, nombre (o el campo que represente el nombre)
-    sql = """
+    # (nivel y key vienen de la lista blanca de arriba)
+    sql = f"""
     WITH h AS (
-      SELECT id_hex, geom_3857
-      FROM public.hex5km
-      WHERE id_hex = %s
+      SELECT geom_3857
+      FROM public.{nivel}
+      WHERE {key} = %s
       LIMIT 1
     )
     SELECT
@@ -217,11 +268,103 @@ def hex_formaciones(request):
     """
 
     with connection.cursor() as cur:
-        cur.execute(sql, [id_hex])
+        cur.execute(sql, [id_value])
         rows = cur.fetchall()
 
     data = [{"id": r[0], "nombre": r[1], "inter_km2": float(r[2]) if r[2] is not None else 0.0} for r in rows]
-    return JsonResponse({"ok": True, "id_hex": id_hex, "count": len(data), "items": data})
+    return FastJsonResponse({"ok": True, "nivel": nivel, key: id_value, "count": len(data), "items": data})
+
+
+
+
+
+@require_GET
+@admission_control("export")
+def export_layer(request, layer):
+    """
+    GET /api/export/<layer>/?format=ndjson|fgb|parquet&cut_reg=..&cut_prov=..&cut_com=..&bbox=minx,miny,maxx,maxy
+    Exporta la capa completa (o filtrada) leyendo con cursor de servidor.
+    NDJSON se emite en streaming; fgb/parquet se arman por bloques en un archivo temporal.
+    """
+    fmt = request.GET.get("format", "ndjson")
+    try:
+        bbox = parse_bbox(request.GET.get("bbox"))
+        filters = {k: request.GET.get(k) for k in ("cut_reg", "cut_prov", "cut_com")}
+        sql, params = build_query(layer, fmt, filters=filters, bbox=bbox)
+    except ExportError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
 
+    chunks = iter_chunks(sql, params)
+    filename = f"{layer}.{EXPORT_FORMATS[fmt]['ext']}"
+    content_type = EXPORT_FORMATS[fmt]["content_type"]
+
+    if fmt == "ndjson":
+        response = StreamingHttpResponse(iter_ndjson(chunks), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    try:
+        f = spool_export(chunks, fmt)
+    except ExportUnavailable as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=501)
+    except ExportError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=404)
+    return FileResponse(f, content_type=content_type, as_attachment=True, filename=filename)
+
+
+@require_GET
+def metrics_view(request):
+    """GET /api/metrics/ -> contadores de este worker (admisión, shedding, timeouts)."""
+    return JsonResponse(metrics.snapshot())
+
+
+def _staff_only(request):
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({"ok": False, "error": "Requiere usuario staff"}, status=403)
+    return None
+
+
+def jobs(request):
+    """
+    GET  /api/jobs/ -> últimos trabajos
+    POST /api/jobs/ {"kind": "import_shp", "params": {"shp": "/data/x.zip", ...}} -> encola
+    """
+    denied = _staff_only(request)
+    if denied:
+        return denied
+
+    if request.method == "POST":
+        try:
+            body = json.loads(request.body or b"{}")
+            job = enqueue(body.get("kind"), body.get("params") or {})
+        except (ValueError, AttributeError) as e:
+            return JsonResponse({"ok": False, "error": str(e)}, status=400)
+        return JsonResponse({"ok": True, "job": job_as_dict(job)}, status=201)
+
+    items = [job_as_dict(j) for j in ImportJob.objects.all()[:50]]
+    return JsonResponse({"ok": True, "count": len(items), "items": items})
+
+
+@require_GET
+def job_detail(request, job_id):
+    """GET /api/jobs/<id>/ -> estado, etapa, progreso y throughput del trabajo."""
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    job = ImportJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({"ok": False, "error": "No existe el trabajo"}, status=404)
+    return JsonResponse({"ok": True, "job": job_as_dict(job)})
 
 
+@require_POST
+def job_cancel(request, job_id):
+    """POST /api/jobs/<id>/cancel/"""
+    denied = _staff_only(request)
+    if denied:
+        return denied
+    try:
+        job = request_cancel(job_id)
+    except ImportJob.DoesNotExist:
+        return JsonResponse({"ok": False, "error": "No existe el trabajo"}, status=404)
+    return JsonResponse({"ok": True, "job": job_as_dict(job)})
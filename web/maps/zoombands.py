@@ -0,0 +1,263 @@
+"""
+Geometrías precalculadas por banda de zoom, con tolerancias derivadas de la
+resolución del tile.
+
+Un tile MVT de zoom z con extent E cuantiza a una grilla de
+WORLD_SIZE / (2**z * E) metros (EPSG:3857). Por banda [z_min, z_max]:
+- se simplifica con tolerancia px * pixel(z_max) (la más fina de la banda)
+- se ajusta a la grilla del tile en z_max (alineada al origen de 3857)
+- se descartan las geometrías que colapsan (menores a un pixel)
+La última banda (hasta RAW_MAX_ZOOM) guarda la geometría completa.
+
+El resultado queda en <capa>_zbands con una columna int4range `zooms` y un
+índice GIST (zooms, geom_3857), que es lo que consulta Tegola.
+"""
+import math
+
+from sqlalchemy import text
+
+from .hexgrid import quote_ident, swap_statements
+
+WORLD_SIZE = 40075016.685578488
+ORIGIN_SHIFT = WORLD_SIZE / 2.0
+RAW_MAX_ZOOM = 30
+DEFAULT_PX = 0.5
+DEFAULT_BUFFER = 64
+
+# Capas servidas por Tegola desde <name>_zbands.
+# extent: el mismo de tegola/config.toml (4096 por defecto en Tegola)
+# before_sql: la geometría que servía Tegola antes de las bandas (:z = zoom),
+# para que zoom_report compare contra lo que realmente se enviaba
+ZOOM_BAND_LAYERS = {
+    "hex5km": {
+        "source": "hex5km",
+        "columns": ["gid", "id_hex", "riqueza_sp", "cut_reg", "cut_prov", "cut_com"],
+        "kind": "polygon",
+        "extent": 4096,
+        "min_zoom": 7,       # zooms menores salen de la pirámide (hex20km/hex80km)
+        "max_zoom": 14,      # desde aquí, geometría completa
+        "raw_grid": None,
+        "subdivide": None,
+        "before_sql": """
+            CASE
+              WHEN :z <= 8  THEN ST_SimplifyPreserveTopology(geom_3857, 80)
+              WHEN :z <= 10 THEN ST_SimplifyPreserveTopology(geom_3857, 25)
+              WHEN :z <= 20 THEN ST_SimplifyPreserveTopology(geom_3857, 5)
+              ELSE geom_3857
+            END""",
+    },
+    "hex5km_edges": {
+        "source": "hex5km_edges",
+        "columns": [
+            "gid", "id_hex_a", "id_hex_b", "cut_reg_a", "cut_reg_b",
+            "cut_prov_a", "cut_prov_b", "cut_com_a", "cut_com_b",
+        ],
+        "kind": "line",
+        "extent": 4096,
+        "min_zoom": 7,
+        "max_zoom": 14,
+        "raw_grid": None,
+        "subdivide": None,
+        "before_sql": """
+            CASE
+              WHEN :z <= 8  THEN ST_Simplify(geom_3857, 80)
+              WHEN :z <= 10 THEN ST_Simplify(geom_3857, 25)
+              WHEN :z <= 20 THEN ST_Simplify(geom_3857, 5)
+              ELSE geom_3857
+            END""",
+    },
+    "formaciones": {
+        "source": "formaciones_fixed",
+        "columns": ["gid", "formacion"],
+        "kind": "polygon",
+        "extent": 8192,
+        "min_zoom": 0,
+        "max_zoom": 14,
+        "raw_grid": 0.1,     # lo que antes hacía Tegola en cada request
+        "subdivide": 255,
+        "before_sql": """
+            ST_Subdivide(
+              ST_MakeValid(ST_Buffer(ST_SnapToGrid(ST_Force2D(geom_3857), 0.1), 0)),
+              255
+            )""",
+    },
+}
+
+
+def zbands_table_name(layer: str) -> str:
+    return f"{layer}_zbands"
+
+
+def pixel_size(zoom: int, extent: int) -> float:
+    """Tamaño (m) de una unidad de la grilla del tile en `zoom`."""
+    return WORLD_SIZE / ((2 ** zoom) * extent)
+
+
+def tolerance(zoom: int, extent: int, px: float = DEFAULT_PX) -> float:
+    return px * pixel_size(zoom, extent)
+
+
+def make_bands(min_zoom: int, max_zoom: int, width: int = 2):
+    """[(z_min, z_max), ...] de `width` zooms, más la banda completa final."""
+    bands = []
+    z = min_zoom
+    while z < max_zoom:
+        bands.append((z, min(z + width - 1, max_zoom - 1)))
+        z += width
+    bands.append((max_zoom, RAW_MAX_ZOOM))
+    return bands
+
+
+def _geom_expr(spec, z_min, z_max, px, extent):
+    """Expresión SQL de la geometría para una banda (la última es la completa)."""
+    g = "ST_Force2D(geom_3857)"
+    extract = 3 if spec["kind"] == "polygon" else 2
+    raw = z_max >= RAW_MAX_ZOOM
+
+    if raw:
+        if spec["raw_grid"]:
+            g = f"ST_SnapToGrid({g}, {spec['raw_grid']!r})"
+    else:
+        tol = tolerance(z_max, extent, px)
+        grid = pixel_size(z_max, extent)
+        simplify = "ST_SimplifyPreserveTopology" if spec["kind"] == "polygon" else "ST_Simplify"
+        g = (
+            f"ST_SnapToGrid({simplify}({g}, {tol!r}), "
+            f"{-ORIGIN_SHIFT!r}, {-ORIGIN_SHIFT!r}, {grid!r}, {grid!r})"
+        )
+
+    if spec["kind"] == "polygon":
+        g = f"ST_MakeValid({g})"
+    g = f"ST_CollectionExtract({g}, {extract})"
+    if spec["subdivide"]:
+        g = f"ST_Subdivide({g}, {int(spec['subdivide'])})"
+    geom_type = "MultiPolygon" if spec["kind"] == "polygon" else "MultiLineString"
+    return f"ST_Multi({g})::geometry({geom_type}, 3857)"
+
+
+def describe_bands(layer, px=DEFAULT_PX, width=2, extent=None):
+    """[(z_min, z_max, tolerancia, grilla)] de la capa (None en la banda completa)."""
+    spec = ZOOM_BAND_LAYERS[layer]
+    extent = extent or spec["extent"]
+    out = []
+    for z_min, z_max in make_bands(spec["min_zoom"], spec["max_zoom"], width):
+        if z_max >= RAW_MAX_ZOOM:
+            out.append((z_min, z_max, None, spec["raw_grid"]))
+        else:
+            out.append((z_min, z_max, tolerance(z_max, extent, px), pixel_size(z_max, extent)))
+    return out
+
+
+def build_zoom_bands(engine, layer, schema="public", px=DEFAULT_PX, width=2, extent=None) -> int:
+    """(Re)construye <layer>_zbands. Retorna la cantidad de filas."""
+    spec = ZOOM_BAND_LAYERS[layer]
+    extent = extent or spec["extent"]
+    table = zbands_table_name(layer)
+    tmp = f"{table}_build"
+    full_src = f"{quote_ident(schema)}.{quote_ident(spec['source'])}"
+    full_tmp = f"{quote_ident(schema)}.{quote_ident(tmp)}"
+    cols = ", ".join(quote_ident(c) for c in spec["columns"])
+
+    selects = []
+    for z_min, z_max, tol, _grid in describe_bands(layer, px, width, extent):
+        selects.append(f"""
+          SELECT int4range({z_min}, {z_max}, '[]') AS zooms,
+                 {float(tol or 0.0)!r}::double precision AS tolerance,
+                 {cols},
+                 {_geom_expr(spec, z_min, z_max, px, extent)} AS geom_3857
+          FROM {full_src}
+          WHERE geom_3857 IS NOT NULL
+        """)
+
+    statements = [
+        f"DROP TABLE IF EXISTS {full_tmp};",
+        f"""
+        CREATE TABLE {full_tmp} AS
+        SELECT * FROM (
+          {" UNION ALL ".join(selects)}
+        ) b
+        WHERE NOT ST_IsEmpty(geom_3857);
+        """,
+        f"""
+        CREATE INDEX {quote_ident(tmp + "_zooms_geom_gix")}
+        ON {full_tmp}
+        USING GIST (zooms, geom_3857);
+        """,
+        f"ANALYZE {full_tmp};",
+    ]
+
+    with engine.begin() as conn:
+        for st in statements:
+            conn.execute(text(st))
+        n = conn.execute(text(f"SELECT COUNT(*) FROM {full_tmp};")).scalar()
+        # Solo DROP + RENAMEs con la tabla que lee Tegola bloqueada
+        for st in swap_statements(schema, tmp, table, index_suffixes=("_zooms_geom_gix",)):
+            conn.execute(text(st))
+
+    return int(n or 0)
+
+
+# ---------------------------------------------------------------------------
+# Reporte
+# ---------------------------------------------------------------------------
+
+def lonlat_to_3857(lon, lat):
+    x = lon * ORIGIN_SHIFT / 180.0
+    y = math.log(math.tan((90.0 + lat) * math.pi / 360.0)) / (math.pi / 180.0)
+    return x, y * ORIGIN_SHIFT / 180.0
+
+
+def tile_for_point(zoom, x, y):
+    n = 2 ** zoom
+    tx = int((x + ORIGIN_SHIFT) / WORLD_SIZE * n)
+    ty = int((ORIGIN_SHIFT - y) / WORLD_SIZE * n)
+    return min(max(tx, 0), n - 1), min(max(ty, 0), n - 1)
+
+
+def _tile_stats(conn, full_table, cols, extent, z, x, y, where="", geom="t.geom_3857"):
+    row = conn.execute(text(f"""
+        WITH env AS (SELECT ST_TileEnvelope(:z, :x, :y) AS e),
+        feats AS (
+          SELECT {cols}, {geom} AS geom_3857
+          FROM {full_table} t, env
+          WHERE t.geom_3857 && env.e {where}
+        ),
+        mvt AS (
+          SELECT ST_AsMVT(q, 'layer', :extent, 'geom') AS tile
+          FROM (
+            SELECT {cols}, ST_AsMVTGeom(f.geom_3857, env.e, :extent, :buffer) AS geom
+            FROM feats f, env
+          ) q
+          WHERE q.geom IS NOT NULL
+        )
+        SELECT
+          (SELECT COALESCE(SUM(ST_NPoints(geom_3857)), 0) FROM feats),
+          (SELECT COALESCE(length(tile), 0) FROM mvt)
+    """), {"z": z, "x": x, "y": y, "extent": extent, "buffer": DEFAULT_BUFFER}).first()
+    return int(row[0]), int(row[1])
+
+
+def zoom_report(engine, layer, schema="public", center=(-70.65, -33.45), zooms=None, extent=None):
+    """
+    Para cada zoom, vértices y bytes del tile MVT que contiene `center`
+    (lon, lat): lo que servía Tegola antes (spec["before_sql"] sobre la
+    tabla fuente) vs. <layer>_zbands.
+    Retorna [(z, x, y, vtx_antes, vtx_despues, bytes_antes, bytes_despues)].
+    """
+    spec = ZOOM_BAND_LAYERS[layer]
+    extent = extent or spec["extent"]
+    full_src = f"{quote_ident(schema)}.{quote_ident(spec['source'])}"
+    full_bands = f"{quote_ident(schema)}.{quote_ident(zbands_table_name(layer))}"
+    cols = ", ".join(quote_ident(c) for c in spec["columns"])
+    px, py = lonlat_to_3857(*center)
+    if zooms is None:
+        zooms = range(spec["min_zoom"], spec["max_zoom"] + 1)
+
+    out = []
+    with engine.begin() as conn:
+        for z in zooms:
+            x, y = tile_for_point(z, px, py)
+            vb, bb = _tile_stats(conn, full_src, cols, extent, z, x, y, geom=spec["before_sql"])
+            va, ba = _tile_stats(conn, full_bands, cols, extent, z, x, y, where=f"AND t.zooms @> {int(z)}")
+            out.append((z, x, y, vb, va, bb, ba))
+    return out